@@ -0,0 +1,80 @@
+"""Benchmark of BatchEvaluate against judging users one by one with Evaluate
+
+Usage:
+    python -m benchmarks.batch_evaluate
+
+Notes:
+    Users and their latest tweets are made up by benchmarks.fake_api and parsed into records.
+    Both paths judge profiles and activity of every user, and their verdicts are compared.
+    masks is the part of batched that runs on columns, without building them from records.
+"""
+import argparse
+import time
+from typing import Dict, List
+
+from benchmarks.fake_api import SyntheticTwitter
+from clients.records import tweet_record, user_record
+from logics.batch_evaluate import BatchEvaluate
+from logics.evaluate import Evaluate
+
+
+def per_user(evaluate: Evaluate, users: list, timelines: Dict[int, list]) -> Dict[int, str]:
+    verdicts: Dict[int, str] = {}
+    for user in users:
+        verdict = evaluate.judge_profile(user)
+        if verdict == 'valuable':
+            verdict = evaluate.judge_activity(timelines.get(user.id))
+        verdicts[user.id] = verdict
+    return verdicts
+
+
+def batched(batch_evaluate: BatchEvaluate, users: list, timelines: Dict[int, list]) -> Dict[int, str]:
+    return batch_evaluate.evaluate(users, timelines).verdicts()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    data = SyntheticTwitter()
+    users = [user_record(data.user(1000000 + idx)) for idx in range(args.users)]
+    timelines = {
+        user.id: None if user.protected else [tweet_record(data.render(tweet, trim_user=True))
+                                              for tweet in data.timeline(user.id, 1)]
+        for user in users
+    }
+    batches: List[list] = [users[idx:idx + args.batch_size] for idx in range(0, len(users), args.batch_size)]
+
+    evaluate = Evaluate()
+    start = time.perf_counter()
+    expected: Dict[int, str] = {}
+    for batch in batches:
+        expected.update(per_user(evaluate, batch, timelines))
+    per_user_elapsed = time.perf_counter() - start
+
+    batch_evaluate = BatchEvaluate()
+    start = time.perf_counter()
+    actual: Dict[int, str] = {}
+    for batch in batches:
+        actual.update(batched(batch_evaluate, batch, timelines))
+    batched_elapsed = time.perf_counter() - start
+
+    # Masks alone, for columns that are already there
+    columns = [batch_evaluate.build_columns(batch, timelines) for batch in batches]
+    start = time.perf_counter()
+    for batch_columns in columns:
+        batch_evaluate.evaluate_columns(batch_columns)
+    masks_elapsed = time.perf_counter() - start
+
+    assert expected == actual
+    print(f'users: {args.users} batch size: {args.batch_size}')
+    print(f'per user: {per_user_elapsed:.3f}s ({args.users / per_user_elapsed:.0f} users/s)')
+    print(f'batched : {batched_elapsed:.3f}s ({args.users / batched_elapsed:.0f} users/s)')
+    print(f'  masks : {masks_elapsed:.3f}s ({args.users / masks_elapsed:.0f} users/s)')
+    print(f'rejections of the last batch: {batch_evaluate.evaluate(batches[-1], timelines).rejections}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,518 @@
+"""Stand-in for the Twitter and Slack APIs the bot uses, serving synthetic data
+
+Usage:
+    python -m benchmarks.fake_api --port 8443
+
+    Then run the bot against it with the printed environment variables e.g.
+        TWITTER_API_HOST=127.0.0.1:8443
+        SLACK_API_URL=https://127.0.0.1:8443/api/chat.postMessage
+        REQUESTS_CA_BUNDLE=/tmp/.../cert.pem
+
+Notes:
+    tweepy always requests https, so the server speaks TLS with a self-signed
+    certificate made by openssl. Every endpoint answers after a latency drawn around
+    the one of the real API and keeps its rate limit, with x-rate-limit-* headers and
+    429 once it is used up. --window-scale shortens the windows of the limits.
+    The same seed gives the same users, tweets and followers.
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+from threading import Lock, Thread
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from utils.settings import TARGET_KEYWORD_AND_IMPORTANCE
+
+TWITTER_TIME_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+TIMELINE_ID_BASE = 10 ** 15
+SEARCH_ID_BASE = 10 ** 17
+FOLLOWER_IDS_PER_PAGE = 5000
+TRUE_VALUES = ('1', 't', 'true', 'True')
+FALSE_VALUES = ('0', 'f', 'false', 'False')
+WINDOW_IN_SECOND = 15 * 60
+LIKE_WINDOW_IN_SECOND = 24 * 60 * 60
+
+# resource of rate_limit_status: (requests per window, mean latency in ms)
+ENDPOINTS: Dict[str, Tuple[int, int]] = {
+    '/search/tweets': (180, 250),
+    '/users/show/:id': (900, 120),
+    '/users/lookup': (900, 200),
+    '/statuses/user_timeline': (900, 150),
+    '/followers/ids': (15, 150),
+    '/favorites/list': (75, 150),
+    '/favorites/create': (1000, 180),
+    '/application/rate_limit_status': (180, 80),
+    'chat.postMessage': (60, 100),
+}
+DESCRIPTIONS = [
+    '',
+    'hi',
+    'エンジニアです',
+    'Webエンジニア。PythonとAWSが好きです。',
+    '駆け出しエンジニア。毎日プログラミングの勉強をしています。',
+    'Data scientist / machine learning / 機械学習 / Kaggle',
+    'フリーランスエンジニア。Ruby on Rails, Go, インフラもやります。',
+    'Official account of a company',
+]
+FILLERS = ['今日も', '勉強', 'しています', 'deploy', 'release', 'やってみた', 'まとめ', 'わからない', 'できた', '！']
+
+
+def format_time(epoch: float) -> str:
+    return datetime.utcfromtimestamp(epoch).strftime(TWITTER_TIME_FORMAT)
+
+
+class SyntheticTwitter:
+    """Users, tweets and followers made up from seed
+
+    Users and their timelines are derived from their ids, so any id can be asked for.
+    Searches go through a fixed pool of tweets by random users, newest first.
+    """
+
+    def __init__(self, seed: int = 0, num_followers: int = 3000, search_pool_size: int = 20000):
+        self.seed = seed
+        self.now = time.time()
+        self.num_followers = num_followers
+        keywords = [keyword for keyword, _ in TARGET_KEYWORD_AND_IMPORTANCE]
+        rng = random.Random(seed)
+        self.search_pool: List[Dict[str, Any]] = []
+        for idx in range(search_pool_size):
+            author_id = rng.randrange(1000000, 2000000000)
+            words = rng.sample(FILLERS, 3) + rng.sample(keywords, rng.choice([1, 1, 2]))
+            rng.shuffle(words)
+            self.search_pool.append({
+                'id': SEARCH_ID_BASE + search_pool_size - idx,
+                'author_id': author_id,
+                # The pool spans 3 days
+                'created_at': self.now - idx * 3 * 24 * 60 * 60 / search_pool_size,
+                'text': ' '.join(words),
+                'favorite_count': int(rng.expovariate(1 / 4)),
+                'retweet_count': int(rng.expovariate(1 / 2)),
+            })
+        self._search_by_id = {tweet['id']: tweet for tweet in self.search_pool}
+
+    def user(self, user_id: int) -> Dict[str, Any]:
+        rng = random.Random(self.seed * 1000003 + user_id)
+        return {
+            'id': user_id,
+            'id_str': str(user_id),
+            'name': f'user {user_id}',
+            'screen_name': f'user{user_id}',
+            'description': rng.choice(DESCRIPTIONS),
+            'followers_count': int(rng.lognormvariate(4, 1.5)),
+            'friends_count': int(rng.lognormvariate(4, 1.2)),
+            'favourites_count': int(rng.lognormvariate(4, 2)),
+            'statuses_count': int(rng.lognormvariate(5, 1.5)),
+            'protected': rng.random() < 0.05,
+            'verified': rng.random() < 0.02,
+            'following': False,
+            'lang': None,
+            'created_at': format_time(self.now - rng.uniform(30, 3000) * 24 * 60 * 60),
+            'default_profile_image': rng.random() < 0.1,
+        }
+
+    def timeline(self, user_id: int, count: int) -> List[Dict[str, Any]]:
+        rng = random.Random(self.seed * 1000003 + user_id + 1)
+        created_at = self.now - rng.expovariate(1 / 15) * 24 * 60 * 60
+        tweets = []
+        for k in range(min(count, 100)):
+            tweets.append({
+                'id': TIMELINE_ID_BASE + user_id * 100 + k,
+                'author_id': user_id,
+                'created_at': created_at,
+                'text': ' '.join(rng.sample(FILLERS, 4)),
+                'favorite_count': int(rng.expovariate(1 / 4)),
+                'retweet_count': int(rng.expovariate(1 / 2)),
+            })
+            created_at -= rng.expovariate(1 / 12) * 60 * 60
+        return tweets
+
+    def tweet(self, tweet_id: int) -> Optional[Dict[str, Any]]:
+        if tweet_id in self._search_by_id:
+            return self._search_by_id[tweet_id]
+        if TIMELINE_ID_BASE <= tweet_id < SEARCH_ID_BASE:
+            user_id, k = divmod(tweet_id - TIMELINE_ID_BASE, 100)
+            timeline = self.timeline(user_id, k + 1)
+            return timeline[k] if k < len(timeline) else None
+        return None
+
+    def render(self, tweet: Dict[str, Any], trim_user: bool = False, include_entities: bool = True) -> Dict[str, Any]:
+        user = self.user(tweet['author_id'])
+        hashtags = [
+            {'text': word[1:], 'indices': [0, 0]}
+            for word in tweet['text'].split() if word.startswith('#')
+        ]
+        rendered = {
+            'id': tweet['id'],
+            'id_str': str(tweet['id']),
+            'created_at': format_time(tweet['created_at']),
+            'text': tweet['text'],
+            'truncated': False,
+            'entities': {'hashtags': hashtags, 'symbols': [], 'user_mentions': [], 'urls': []},
+            'source': 'fake_api',
+            'in_reply_to_status_id': None,
+            'in_reply_to_user_id': None,
+            'user': {'id': user['id'], 'id_str': user['id_str']} if trim_user else user,
+            'is_quote_status': False,
+            'retweet_count': tweet['retweet_count'],
+            'favorite_count': tweet['favorite_count'],
+            'favorited': False,
+            'retweeted': False,
+            'lang': 'ja',
+        }
+        if not include_entities:
+            del rendered['entities']
+        return rendered
+
+    def search(
+            self,
+            query: str,
+            count: int,
+            since_id: Optional[int],
+            max_id: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        terms = [term.strip('"').casefold() for term in query.split(' OR ')]
+        found = []
+        for tweet in self.search_pool:
+            if max_id is not None and tweet['id'] > max_id:
+                continue
+            if since_id is not None and tweet['id'] <= since_id:
+                break
+            text = tweet['text'].casefold()
+            if any(term in text for term in terms):
+                found.append(tweet)
+                if len(found) == count:
+                    break
+        return found
+
+    def follower_ids(self, famous_guy: str) -> List[int]:
+        rng = random.Random(f'{self.seed}:{famous_guy}')
+        return [rng.randrange(1000000, 2000000000) for _ in range(self.num_followers)]
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, code: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.body = {'errors': [{'code': code, 'message': message}]}
+        self.headers = headers or {}
+
+
+class FakeApiServer:
+    """Threaded https server answering like Twitter and Slack
+
+    Args:
+        port: port to listen on. A free one is picked if 0.
+        seed: seed of synthetic data
+        num_followers: followers of each famous user
+        latency_scale: multiplied to latencies of the real API. 0 answers right away.
+        window_scale: rate limit windows are divided by this
+    """
+
+    def __init__(
+            self,
+            port: int = 0,
+            seed: int = 0,
+            num_followers: int = 3000,
+            latency_scale: float = 1.0,
+            window_scale: float = 1.0
+    ):
+        self.data = SyntheticTwitter(seed, num_followers)
+        self.latency_scale = latency_scale
+        self.window_scale = window_scale
+        self.liked: set = set()
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._windows: Dict[str, Tuple[float, int]] = {}
+        self._rng = random.Random(seed)
+        self._lock = Lock()
+        self._directory = tempfile.mkdtemp(prefix='fake_api_')
+        self.ca_bundle, key = self._make_certificate()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self)
+
+            def do_POST(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._httpd.daemon_threads = True
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.ca_bundle, key)
+        self._httpd.socket = context.wrap_socket(self._httpd.socket, server_side=True)
+
+    @property
+    def host(self) -> str:
+        return f'127.0.0.1:{self._httpd.server_address[1]}'
+
+    @property
+    def slack_url(self) -> str:
+        return f'https://{self.host}/api/chat.postMessage'
+
+    @property
+    def environ(self) -> Dict[str, str]:
+        """Environment variables that point the bot at this server"""
+        return {
+            'TWITTER_API_HOST': self.host,
+            'SLACK_API_URL': self.slack_url,
+            'REQUESTS_CA_BUNDLE': self.ca_bundle,
+        }
+
+    def start(self) -> 'FakeApiServer':
+        Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self.stats.items()}
+
+    def handle(self, request: BaseHTTPRequestHandler) -> None:
+        url = urlsplit(request.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(request.headers.get('Content-Length') or 0)
+        if length > 0:
+            body = request.rfile.read(length).decode()
+            params.update({key: values[-1] for key, values in parse_qs(body).items()})
+
+        if url.path == '/__stats':
+            self._respond(request, '__stats', 200, self.snapshot(), {})
+            return
+        route = self._route(url.path)
+        if route is None:
+            error = ApiError(404, 34, 'Sorry, that page does not exist.')
+            self._respond(request, 'unknown', error.status, error.body, {})
+            return
+        endpoint, handler = route
+        limit, latency_in_ms = ENDPOINTS[endpoint]
+        if self.latency_scale > 0:
+            mean = latency_in_ms / 1000 * self.latency_scale
+            time.sleep(self._rng.lognormvariate(math.log(mean), 0.3))
+        headers: Dict[str, str] = {}
+        try:
+            headers = self._consume(endpoint, limit)
+            status, payload = 200, handler(params)
+        except ApiError as e:
+            status, payload, headers = e.status, e.body, {**headers, **e.headers}
+        self._respond(request, endpoint, status, payload, headers)
+
+    def _route(self, path: str):
+        routes = {
+            '/1.1/search/tweets.json': ('/search/tweets', self._search),
+            '/1.1/users/show.json': ('/users/show/:id', self._users_show),
+            '/1.1/users/lookup.json': ('/users/lookup', self._users_lookup),
+            '/1.1/statuses/user_timeline.json': ('/statuses/user_timeline', self._user_timeline),
+            '/1.1/followers/ids.json': ('/followers/ids', self._followers_ids),
+            '/1.1/favorites/list.json': ('/favorites/list', self._favorites_list),
+            '/1.1/favorites/create.json': ('/favorites/create', self._favorites_create),
+            '/1.1/application/rate_limit_status.json': ('/application/rate_limit_status', self._rate_limit_status),
+            '/api/chat.postMessage': ('chat.postMessage', self._slack_post),
+        }
+        return routes.get(path)
+
+    def _window_of(self, endpoint: str) -> float:
+        window = LIKE_WINDOW_IN_SECOND if endpoint == '/favorites/create' else WINDOW_IN_SECOND
+        return window / self.window_scale
+
+    def _consume(self, endpoint: str, limit: int) -> Dict[str, str]:
+        now = time.time()
+        with self._lock:
+            started, used = self._windows.get(endpoint, (now, 0))
+            if now >= started + self._window_of(endpoint):
+                started, used = now, 0
+            reset = started + self._window_of(endpoint)
+            if used >= limit:
+                if endpoint == 'chat.postMessage':
+                    raise ApiError(429, 0, 'ratelimited', {'Retry-After': str(max(int(reset - now), 1))})
+                # Twitter sends no rate limit headers for likes
+                headers = {} if endpoint == '/favorites/create' else self._headers(limit, 0, reset)
+                raise ApiError(429, 88, 'Rate limit exceeded', headers)
+            self._windows[endpoint] = (started, used + 1)
+        if endpoint in ('/favorites/create', 'chat.postMessage'):
+            return {}
+        return self._headers(limit, limit - used - 1, reset)
+
+    @staticmethod
+    def _headers(limit: int, remaining: int, reset: float) -> Dict[str, str]:
+        return {
+            'x-rate-limit-limit': str(limit),
+            'x-rate-limit-remaining': str(remaining),
+            'x-rate-limit-reset': str(int(math.ceil(reset))),
+        }
+
+    def _respond(
+            self,
+            request: BaseHTTPRequestHandler,
+            endpoint: str,
+            status: int,
+            payload: Any,
+            headers: Dict[str, str]
+    ) -> None:
+        body = json.dumps(payload).encode()
+        with self._lock:
+            stats = self.stats[endpoint]
+            stats['requests'] += 1
+            stats['bytes'] += len(body)
+            stats[str(status)] += 1
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json; charset=utf-8')
+        request.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+    @staticmethod
+    def _user_id(params: Dict[str, str]) -> int:
+        value = params.get('user_id') or params.get('id') or params.get('screen_name', '')
+        value = value[4:] if value.startswith('user') else value
+        if not value.isdigit():
+            raise ApiError(404, 50, 'User not found.')
+        return int(value)
+
+    def _search(self, params: Dict[str, str]) -> Dict[str, Any]:
+        count = min(int(params.get('count', 15)), 100)
+        since_id = int(params['since_id']) if 'since_id' in params else None
+        max_id = int(params['max_id']) if 'max_id' in params else None
+        tweets = self.data.search(params.get('q', ''), count, since_id, max_id)
+        include_entities = params.get('include_entities') not in FALSE_VALUES
+        return {
+            'statuses': [self.data.render(tweet, include_entities=include_entities) for tweet in tweets],
+            'search_metadata': {'count': count, 'query': params.get('q', '')},
+        }
+
+    def _users_show(self, params: Dict[str, str]) -> Dict[str, Any]:
+        return self.data.user(self._user_id(params))
+
+    def _users_lookup(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        ids = [int(id_) for id_ in params.get('user_id', '').split(',') if id_.isdigit()][:100]
+        if len(ids) == 0:
+            raise ApiError(404, 17, 'No user matches for specified terms.')
+        with self._lock:
+            self.stats['/users/lookup']['users'] += len(ids)
+        return [self.data.user(id_) for id_ in ids]
+
+    def _user_timeline(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        user_id = self._user_id(params)
+        if self.data.user(user_id)['protected']:
+            raise ApiError(401, 0, 'Not authorized.')
+        count = min(int(params.get('count', 20)), 200)
+        trim_user = params.get('trim_user') in TRUE_VALUES
+        include_entities = params.get('include_entities') not in FALSE_VALUES
+        return [
+            self.data.render(tweet, trim_user, include_entities)
+            for tweet in self.data.timeline(user_id, count)
+        ]
+
+    def _followers_ids(self, params: Dict[str, str]) -> Dict[str, Any]:
+        famous_guy = params.get('id') or params.get('screen_name') or params.get('user_id', '')
+        ids = self.data.follower_ids(famous_guy)
+        cursor = int(params.get('cursor', -1))
+        page = 0 if cursor == -1 else cursor
+        chunk = ids[page * FOLLOWER_IDS_PER_PAGE:(page + 1) * FOLLOWER_IDS_PER_PAGE]
+        has_next = (page + 1) * FOLLOWER_IDS_PER_PAGE < len(ids)
+        return {
+            'ids': chunk,
+            'next_cursor': page + 1 if has_next else 0,
+            'previous_cursor': page - 1 if page > 0 else 0,
+        }
+
+    def _favorites_list(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        with self._lock:
+            liked = sorted(self.liked, reverse=True)
+        max_id = int(params['max_id']) if 'max_id' in params else None
+        liked = [id_ for id_ in liked if max_id is None or id_ <= max_id][:int(params.get('count', 20))]
+        return [self.data.render(self.data.tweet(id_)) for id_ in liked]
+
+    def _favorites_create(self, params: Dict[str, str]) -> Dict[str, Any]:
+        tweet_id = int(params.get('id', 0))
+        tweet = self.data.tweet(tweet_id)
+        if tweet is None:
+            raise ApiError(404, 144, 'No status found with that ID.')
+        with self._lock:
+            if tweet_id in self.liked:
+                raise ApiError(403, 139, 'You have already favorited this status.')
+            self.liked.add(tweet_id)
+            self.stats['/favorites/create']['liked'] += 1
+        rendered = self.data.render(tweet)
+        rendered['favorited'] = True
+        return rendered
+
+    def _rate_limit_status(self, params: Dict[str, str]) -> Dict[str, Any]:
+        now = time.time()
+        resources: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        with self._lock:
+            for endpoint, (limit, _) in ENDPOINTS.items():
+                if not endpoint.startswith('/') or endpoint == '/favorites/create':
+                    continue
+                started, used = self._windows.get(endpoint, (now, 0))
+                if now >= started + self._window_of(endpoint):
+                    started, used = now, 0
+                family = endpoint.split('/')[1]
+                resources[family][endpoint] = {
+                    'limit': limit,
+                    'remaining': limit - used,
+                    'reset': int(math.ceil(started + self._window_of(endpoint))),
+                }
+        return {'rate_limit_context': {'access_token': 'fake'}, 'resources': resources}
+
+    def _slack_post(self, params: Dict[str, str]) -> Dict[str, Any]:
+        with self._lock:
+            self.stats['chat.postMessage']['messages'] += 1
+        return {'ok': True, 'channel': params.get('channel'), 'ts': f'{time.time():.6f}'}
+
+    def _make_certificate(self) -> Tuple[str, str]:
+        cert = os.path.join(self._directory, 'cert.pem')
+        key = os.path.join(self._directory, 'key.pem')
+        subprocess.run(
+            [
+                'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                '-keyout', key, '-out', cert, '-days', '1', '-subj', '/CN=localhost',
+                '-addext', 'subjectAltName=IP:127.0.0.1,DNS:localhost',
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        return cert, key
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--followers', type=int, default=3000)
+    parser.add_argument('--latency-scale', type=float, default=1.0)
+    parser.add_argument('--window-scale', type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = FakeApiServer(args.port, args.seed, args.followers, args.latency_scale, args.window_scale)
+    for key, value in server.environ.items():
+        print(f'{key}={value}')
+    server.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark of RecordParser against tweepy's ModelParser
+
+Usage:
+    python -m benchmarks.response_parsing
+
+Notes:
+    Payloads are search results(100 tweets with their users), timelines(20 tweets)
+    and users/lookup(100 users) made up by benchmarks.fake_api.
+    memory is what the parsed objects of all --pages pages hold, measured by tracemalloc.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import List, Tuple
+
+from tweepy.parsers import ModelParser
+
+from benchmarks.fake_api import SyntheticTwitter
+from clients.records import RecordParser, orjson
+
+# (name, payload_type, payload_list)
+PAYLOADS = [
+    ('search', 'search_results', False),
+    ('timeline', 'status', True),
+    ('lookup', 'user', True),
+]
+
+
+def make_payloads(data: SyntheticTwitter, kind: str, pages: int) -> List[str]:
+    payloads: List[str] = []
+    for page in range(pages):
+        if kind == 'search':
+            tweets = data.search_pool[page * 100:(page + 1) * 100]
+            payload = {'statuses': [data.render(tweet) for tweet in tweets], 'search_metadata': {}}
+        elif kind == 'timeline':
+            payload = [data.render(tweet) for tweet in data.timeline(1000000 + page, 20)]
+        else:
+            payload = [data.user(1000000 + page * 100 + idx) for idx in range(100)]
+        payloads.append(json.dumps(payload, ensure_ascii=False))
+    return payloads
+
+
+def measure(parser, method, payloads: List[str]) -> Tuple[float, int]:
+    start = time.perf_counter()
+    for payload in payloads:
+        parser.parse(method, payload)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    parsed = [parser.parse(method, payload) for payload in payloads]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsed
+    return elapsed, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=100)
+    args = parser.parse_args()
+
+    data = SyntheticTwitter(search_pool_size=args.pages * 100)
+    print(f'decoder of records: {"orjson" if orjson is not None else "json"}')
+    for kind, payload_type, payload_list in PAYLOADS:
+        payloads = make_payloads(data, kind, args.pages)
+        method = SimpleNamespace(
+            api=None,
+            payload_type=payload_type,
+            payload_list=payload_list,
+            session=SimpleNamespace(params={}),
+        )
+        model_elapsed, model_memory = measure(ModelParser(), method, payloads)
+        record_elapsed, record_memory = measure(RecordParser(), method, payloads)
+        print(f'{kind} pages: {args.pages} bytes: {sum(len(payload) for payload in payloads)}')
+        print(f'  models : {model_elapsed:.3f}s {model_memory / 2 ** 20:.1f}MB')
+        print(f'  records: {record_elapsed:.3f}s {record_memory / 2 ** 20:.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
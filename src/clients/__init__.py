@@ -1,3 +1,12 @@
+from .cassette import CASSETTE, Cassette, CassetteError
+from .errors import ClientError, LikeLimitExceeded, NoResponseError
+from .profiles import (
+    PROFILE_METRICS,
+    RequestProfile,
+    ACTIVITY_PROBE,
+    LIKE_CANDIDATE,
+    KEYWORD_SEARCH,
+)
 from .slack_client import (
     SLACK_INFO,
     SLACK_WARNING,
@@ -6,6 +15,17 @@ from .slack_client import (
 from .twitter_client import TwitterClient
 
 __all__ = [
+    'CASSETTE',
+    'Cassette',
+    'CassetteError',
+    'ClientError',
+    'LikeLimitExceeded',
+    'NoResponseError',
+    'PROFILE_METRICS',
+    'RequestProfile',
+    'ACTIVITY_PROBE',
+    'LIKE_CANDIDATE',
+    'KEYWORD_SEARCH',
     'SLACK_INFO',
     'SLACK_WARNING',
     'SLACK_ERROR',
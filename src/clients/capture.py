@@ -0,0 +1,57 @@
+"""tweepy.API that keeps the last response per thread
+
+tweepy.API.last_response is shared by every thread using the api, so a thread
+reading it after a call may get the response of another thread's call.
+CapturingAPI hands every response to the thread that sent the request instead.
+"""
+from threading import local
+from typing import Callable
+
+
+class _CapturingAuth:
+    """Auth of tweepy.API that hands every response to on_response in the thread that sent the request"""
+
+    def __init__(self, auth, on_response: Callable[..., None]):
+        self._auth = auth
+        self._on_response = on_response
+
+    def apply_auth(self):
+        auth = self._auth.apply_auth() if self._auth else None
+
+        def apply(request):
+            if auth is not None:
+                request = auth(request)
+            request.register_hook('response', self._on_response)
+            return request
+
+        return apply
+
+    def __getattr__(self, name: str):
+        return getattr(self._auth, name)
+
+
+class CapturingAPI:
+    """tweepy.API whose last_response is kept per thread
+
+    Other attributes are those of the wrapped api. Set last_response to None
+    before a call to tell a call that got no response from an earlier one.
+    """
+
+    def __init__(self, api):
+        self._api = api
+        self._local = local()
+        api.auth = _CapturingAuth(api.auth, self._capture)
+
+    @property
+    def last_response(self):
+        return getattr(self._local, 'response', None)
+
+    @last_response.setter
+    def last_response(self, response) -> None:
+        self._local.response = response
+
+    def __getattr__(self, name: str):
+        return getattr(self._api, name)
+
+    def _capture(self, response, **kwargs) -> None:
+        self._local.response = response
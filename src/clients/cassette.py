@@ -0,0 +1,283 @@
+"""Record responses of twitter to a cassette and replay them without network
+
+A cassette is a pair of files.
+    path: compressed frames, each of which is one response as JSON
+    path.idx: JSON lines. The first one is the header({"codec": ...}) and the others are [key, offset, length].
+
+Calls are keyed by the method of tweepy.API and its arguments. Replays read only the frames
+they need through the index, and the n-th call of a key gets the n-th response recorded for it.
+
+Examples:
+    TWITTER_CASSETTE_MODE=record python main_bot.py
+    TWITTER_CASSETTE_MODE=replay python -m benchmarks.end_to_end ...
+"""
+import atexit
+from collections import defaultdict
+from functools import partial
+import json
+import os
+from threading import Lock
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import zlib
+
+from requests.structures import CaseInsensitiveDict
+from tweepy.error import RateLimitError, TweepError, is_rate_limit_error_message
+
+from .capture import CapturingAPI
+from .errors import ClientError
+from utils import (
+    TWITTER_CASSETTE_MODE,
+    TWITTER_CASSETTE_PATH,
+)
+
+try:
+    import zstandard
+except ImportError:
+    # Cassettes are written with zlib instead. The codec is kept in the index.
+    zstandard = None
+
+RECORD = 'record'
+REPLAY = 'replay'
+# Methods of tweepy.API that are recorded: (payload_type, payload_list)
+PAYLOADS: Dict[str, Tuple[str, bool]] = {
+    'search': ('search_results', False),
+    'get_user': ('user', False),
+    'lookup_users': ('user', True),
+    'user_timeline': ('status', True),
+    'followers_ids': ('ids', False),
+    'favorites': ('status', True),
+    'create_favorite': ('status', False),
+    'rate_limit_status': ('json', False),
+}
+HEADERS = ('x-rate-limit-limit', 'x-rate-limit-remaining', 'x-rate-limit-reset', 'retry-after')
+
+
+class CassetteError(ClientError):
+    pass
+
+
+class CassetteResponse:
+    """Recorded response standing in for requests.Response"""
+
+    def __init__(self, status_code: int, url: str, headers: CaseInsensitiveDict, text: str):
+        self.status_code = status_code
+        self.url = url
+        self.headers = headers
+        self.text = text
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode()
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+def make_key(name: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+    return json.dumps([name, list(args), kwargs], sort_keys=True, separators=(',', ':'), default=str)
+
+
+class Cassette:
+    """Compressed and indexed responses of twitter
+
+    Files are opened on the first record or play, so creating one costs nothing.
+    """
+
+    def __init__(self, path: str, mode: str):
+        if mode not in (RECORD, REPLAY):
+            raise CassetteError(f'Unknown cassette mode: {mode}')
+        self.path = path
+        self.mode = mode
+        self._codec: Optional[str] = None
+        self._compress: Optional[Callable[[bytes], bytes]] = None
+        self._decompress: Optional[Callable[[bytes], bytes]] = None
+        self._data = None
+        self._index_file = None
+        self._index: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._played: Dict[str, int] = defaultdict(int)
+        self._lock = Lock()
+        atexit.register(self.close)
+
+    @property
+    def index_path(self) -> str:
+        return f'{self.path}.idx'
+
+    def wrap(self, api) -> 'CassetteAPI':
+        return CassetteAPI(api, self)
+
+    def record(self, key: str, entry: Dict[str, Any]) -> None:
+        frame = json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode()
+        with self._lock:
+            if self._data is None:
+                self._open_to_record()
+            frame = self._compress(frame)
+            offset = self._data.tell()
+            self._data.write(frame)
+            self._data.flush()
+            self._index_file.write(json.dumps([key, offset, len(frame)]) + '\n')
+            self._index_file.flush()
+            self._index[key].append((offset, len(frame)))
+
+    def play(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the next response recorded for key
+
+        Returns:
+            Recorded response or None if key has never been recorded.
+            The last one is repeated once all of them have been played.
+
+        """
+        with self._lock:
+            if self._data is None:
+                self._open_to_replay()
+            frames = self._index.get(key)
+            if not frames:
+                return None
+            offset, length = frames[min(self._played[key], len(frames) - 1)]
+            self._played[key] += 1
+            self._data.seek(offset)
+            frame = self._data.read(length)
+        return json.loads(self._decompress(frame))
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._data, self._index_file):
+                if f is not None:
+                    f.close()
+            self._data = None
+            self._index_file = None
+
+    def _open_to_record(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path):
+            # Append to the cassette with the codec it has been written with
+            with open(self.index_path) as f:
+                self._set_codec(json.loads(f.readline())['codec'])
+            self._index_file = open(self.index_path, mode='a')
+        else:
+            self._set_codec('zlib' if zstandard is None else 'zstd')
+            self._index_file = open(self.index_path, mode='w')
+            self._index_file.write(json.dumps({'codec': self._codec}) + '\n')
+        self._data = open(self.path, mode='ab')
+
+    def _open_to_replay(self) -> None:
+        if not os.path.exists(self.index_path):
+            raise CassetteError(f'Cassette {self.path} has not been recorded')
+        with open(self.index_path) as f:
+            self._set_codec(json.loads(f.readline())['codec'])
+            for line in f:
+                if not line.endswith('\n'):
+                    # Cut off by a recording that did not finish
+                    break
+                key, offset, length = json.loads(line)
+                self._index[key].append((offset, length))
+        self._data = open(self.path, mode='rb')
+
+    def _set_codec(self, codec: str) -> None:
+        if codec == 'zstd':
+            if zstandard is None:
+                raise CassetteError(f'zstandard is required to read {self.path}')
+            self._compress = zstandard.ZstdCompressor(level=10).compress
+            self._decompress = zstandard.ZstdDecompressor().decompress
+        elif codec == 'zlib':
+            self._compress = partial(zlib.compress, level=9)
+            self._decompress = zlib.decompress
+        else:
+            raise CassetteError(f'Unknown codec: {codec}')
+        self._codec = codec
+
+
+class CassetteAPI(CapturingAPI):
+    """tweepy.API whose methods in PAYLOADS are recorded to or replayed from a cassette
+
+    Other attributes are those of the wrapped api. last_response is kept per thread,
+    so that concurrent calls each see their own response.
+    """
+
+    def __init__(self, api, cassette: Cassette):
+        super().__init__(api)
+        self._cassette = cassette
+
+    def __getattr__(self, name: str):
+        if name in PAYLOADS:
+            return partial(self._call, name)
+        return getattr(self._api, name)
+
+    def _call(self, name: str, *args, **kwargs):
+        key = make_key(name, args, kwargs)
+        if self._cassette.mode == REPLAY:
+            return self._replay(name, key, kwargs)
+
+        self._local.response = None
+        try:
+            result = getattr(self._api, name)(*args, **kwargs)
+        except TweepError as e:
+            self._cassette.record(key, self._entry(self.last_response, str(e.reason)))
+            raise
+        if self.last_response is not None:
+            self._cassette.record(key, self._entry(self.last_response))
+        return result
+
+    @staticmethod
+    def _entry(response, reason: Optional[str] = None) -> Dict[str, Any]:
+        if response is None:
+            # Request that never got a response e.g. connection error
+            return {'status': None, 'reason': reason, 'at': time.time()}
+        return {
+            'status': response.status_code,
+            'url': response.url,
+            'headers': {key: response.headers[key] for key in HEADERS if key in response.headers},
+            'body': response.text,
+            'at': time.time(),
+        }
+
+    def _replay(self, name: str, key: str, kwargs: Dict[str, Any]):
+        entry = self._cassette.play(key)
+        self._local.response = None
+        if entry is None:
+            raise TweepError(f'Failed to send request: {name} has not been recorded')
+        if entry['status'] is None:
+            raise TweepError(entry['reason'])
+
+        response = CassetteResponse(entry['status'], entry['url'], self._replay_headers(entry), entry['body'])
+        self._local.response = response
+        if not 200 <= response.status_code < 300:
+            try:
+                error_msg, api_code = self._api.parser.parse_error(response.text)
+            except Exception:
+                error_msg, api_code = f'Twitter error response: status code = {response.status_code}', None
+            if is_rate_limit_error_message(error_msg):
+                raise RateLimitError(error_msg, response)
+            raise TweepError(error_msg, response, api_code=api_code)
+
+        payload_type, payload_list = PAYLOADS[name]
+        method = SimpleNamespace(
+            api=self,
+            payload_type=payload_type,
+            payload_list=payload_list,
+            session=SimpleNamespace(params=kwargs),
+        )
+        return self._api.parser.parse(method, response.text)
+
+    @staticmethod
+    def _replay_headers(entry: Dict[str, Any]) -> CaseInsensitiveDict:
+        """Recorded headers moved to the clock of the replay
+
+        reset is as far ahead as it was when recorded. remaining of successful responses is
+        back to limit so that replays are not throttled by the quota of the recorded day.
+        """
+        headers = CaseInsensitiveDict(entry['headers'])
+        if 'x-rate-limit-reset' in headers:
+            ahead_in_sec = max(float(headers['x-rate-limit-reset']) - entry['at'], 0)
+            headers['x-rate-limit-reset'] = str(int(time.time() + ahead_in_sec))
+        if 'x-rate-limit-limit' in headers and entry['status'] < 400:
+            headers['x-rate-limit-remaining'] = headers['x-rate-limit-limit']
+        return headers
+
+
+CASSETTE: Optional[Cassette] = (
+    Cassette(TWITTER_CASSETTE_PATH, TWITTER_CASSETTE_MODE) if TWITTER_CASSETTE_MODE else None
+)
@@ -0,0 +1,20 @@
+from typing import Optional
+
+
+class ClientError(Exception):
+    pass
+
+
+class NoResponseError(ClientError):
+    """Twitter could not be reached, so nothing is known about what was asked"""
+
+
+class LikeLimitExceeded(ClientError):
+    """favorites/create has been locked out
+
+    reset_at is the epoch time the lockout ends if Twitter told it.
+    """
+
+    def __init__(self, reset_at: Optional[float] = None):
+        super().__init__(f'Like request limit has been exceeded. reset_at: {reset_at}')
+        self.reset_at = reset_at
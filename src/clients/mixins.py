@@ -1,10 +1,15 @@
 import tweepy
 
+from .capture import CapturingAPI
+from .cassette import CASSETTE
+from .records import RecordParser
 from utils import (
     CONSUMER_KEY,
     CONSUMER_SECRET,
     ACCESS_TOKEN,
     ACCESS_TOKEN_SECRET,
+    TWITTER_API_HOST,
+    LEAN_TWITTER_RESPONSES,
     SLACK_TOKEN
 )
 
@@ -19,7 +24,8 @@ class TwitterCredentialMixin(CredentialMixinBase):
     def __init__(self):
         __auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
         __auth.set_access_token(ACCESS_TOKEN, ACCESS_TOKEN_SECRET)
-        self.__api = tweepy.API(__auth)
+        api = tweepy.API(__auth, host=TWITTER_API_HOST, parser=RecordParser() if LEAN_TWITTER_RESPONSES else None)
+        self.__api = CapturingAPI(api) if CASSETTE is None else CASSETTE.wrap(api)
 
     # TODO: api should not belong to credential
     @property
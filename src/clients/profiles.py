@@ -0,0 +1,132 @@
+"""Request profiles that ask twitter for no more than a call site reads
+
+A profile fixes count, trim_user, include_entities, exclude_replies, include_rts and tweet_mode
+of statuses/user_timeline and search/tweets. Bytes and latency of responses are counted
+per profile by PROFILE_METRICS.
+
+Examples:
+    >>> TwitterClient().fetch_user_tweet(id=user_id, profile=ACTIVITY_PROBE)
+"""
+from dataclasses import dataclass, field
+from functools import wraps
+from threading import Lock
+import time
+from typing import Any, Dict, Optional
+
+
+@dataclass(frozen=True)
+class RequestProfile:
+    """Parameters of a request. None leaves the parameter to twitter's default.
+
+    Notes:
+        count is applied before exclude_replies and include_rts filter the timeline,
+        so fewer tweets than count may come back when they are set.
+    """
+    name: str
+    count: Optional[int] = None
+    trim_user: Optional[bool] = None
+    include_entities: Optional[bool] = None
+    exclude_replies: Optional[bool] = None
+    include_rts: Optional[bool] = None
+    tweet_mode: Optional[str] = None
+
+    def params(self) -> Dict[str, Any]:
+        # tweepy sends True as 'True' while twitter expects 'true'
+        return {
+            key: ('true' if value else 'false') if isinstance(value, bool) else value
+            for key, value in (
+                ('count', self.count),
+                ('trim_user', self.trim_user),
+                ('include_entities', self.include_entities),
+                ('exclude_replies', self.exclude_replies),
+                ('include_rts', self.include_rts),
+                ('tweet_mode', self.tweet_mode),
+            )
+            if value is not None
+        }
+
+
+# Defaults of the endpoints
+TIMELINE = RequestProfile('timeline')
+SEARCH = RequestProfile('search')
+# Evaluate.is_active reads only created_at of the latest tweet. Replies and retweets are activity too.
+ACTIVITY_PROBE = RequestProfile('activity_probe', count=1, trim_user=True, include_entities=False)
+# find_likable_tweet reads like and retweet states of the user's own tweets
+LIKE_CANDIDATE = RequestProfile(
+    'like_candidate',
+    count=20,
+    trim_user=True,
+    include_entities=False,
+    exclude_replies=True,
+    include_rts=False
+)
+# Authors are evaluated, so users are kept. Keywords are routed by hashtags and the text,
+# which is cut at 140 characters unless it is extended.
+KEYWORD_SEARCH = RequestProfile('keyword_search', tweet_mode='extended')
+
+
+@dataclass
+class ProfileMetrics:
+    """Requests, bytes received and latency per request profile"""
+    requests: Dict[str, int] = field(default_factory=dict)
+    bytes: Dict[str, int] = field(default_factory=dict)
+    latency_in_sec: Dict[str, float] = field(default_factory=dict)
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    def add(self, name: str, latency_in_sec: float, response=None) -> None:
+        num_bytes = len(response.content) if response is not None else 0
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            self.bytes[name] = self.bytes.get(name, 0) + num_bytes
+            self.latency_in_sec[name] = self.latency_in_sec.get(name, 0.) + latency_in_sec
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {
+                    'requests': num,
+                    'avg_bytes': self.bytes[name] / num,
+                    'avg_latency_in_sec': self.latency_in_sec[name] / num,
+                }
+                for name, num in self.requests.items()
+            }
+
+    def __str__(self) -> str:
+        return ' '.join(
+            f"{name}:{values['requests']}req/{values['avg_bytes']:.0f}B/{values['avg_latency_in_sec']:.3f}s"
+            for name, values in self.snapshot().items()
+        )
+
+
+PROFILE_METRICS = ProfileMetrics()
+
+
+def with_profile(default: RequestProfile):
+    """Add parameters of profile(a keyword argument of the decorated method) to the request
+
+    Args:
+        default: profile used when the caller gives none
+
+    Notes:
+        Parameters given by the caller win over the profile.
+        The decorated method has to be a method of a client with api(CapturingAPI),
+        so that bytes are those of the response of the calling thread.
+        Apply it inside prevent_from_limit_error so that waits for rate limits are not counted.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, profile: RequestProfile = default, **kwargs):
+            started = time.monotonic()
+            self.api.last_response = None
+            try:
+                return func(self, *args, **{**profile.params(), **kwargs})
+            finally:
+                PROFILE_METRICS.add(
+                    profile.name,
+                    time.monotonic() - started,
+                    getattr(self.api, 'last_response', None)
+                )
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,113 @@
+"""Lean records of tweets and users parsed straight from the JSON of twitter
+
+tweepy models keep every field of a response, nested models and a reference to the api.
+Records keep only what Evaluate, LikeLogic and save_new_users read, so thousands of them
+per cycle cost a fraction of the parse time and memory.
+"""
+from datetime import datetime
+import json
+from typing import Any, Dict, NamedTuple, Tuple
+
+from tweepy.error import TweepError
+from tweepy.parsers import ModelParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+loads = json.loads if orjson is None else orjson.loads
+
+MONTHS = {
+    month: idx + 1
+    for idx, month in enumerate(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
+}
+
+
+class UserRecord(NamedTuple):
+    id: int
+    name: str = ''
+    following: bool = False
+    description: str = ''
+    followers_count: int = 0
+    friends_count: int = 0
+    favourites_count: int = 0
+    protected: bool = False
+    verified: bool = False
+
+
+class TweetRecord(NamedTuple):
+    id: int
+    created_at: datetime
+    text: str
+    hashtags: Tuple[str, ...]
+    favorited: bool
+    retweeted: bool
+    favorite_count: int
+    retweet_count: int
+    author: UserRecord
+
+
+def parse_created_at(text: str) -> datetime:
+    """Parse created_at of twitter e.g. 'Wed Oct 10 20:19:24 +0000 2018' into naive UTC like tweepy does"""
+    return datetime(
+        int(text[26:30]), MONTHS[text[4:7]], int(text[8:10]),
+        int(text[11:13]), int(text[14:16]), int(text[17:19])
+    )
+
+
+def user_record(user: Dict[str, Any]) -> UserRecord:
+    # Users of tweets requested with trim_user only have ids
+    return UserRecord(
+        user['id'],
+        user.get('name', ''),
+        bool(user.get('following')),
+        user.get('description') or '',
+        user.get('followers_count', 0),
+        user.get('friends_count', 0),
+        user.get('favourites_count', 0),
+        user.get('protected', False),
+        user.get('verified', False),
+    )
+
+
+def tweet_record(tweet: Dict[str, Any]) -> TweetRecord:
+    return TweetRecord(
+        tweet['id'],
+        parse_created_at(tweet['created_at']),
+        tweet.get('full_text') or tweet.get('text') or '',
+        tuple(hashtag['text'] for hashtag in (tweet.get('entities') or {}).get('hashtags', ())),
+        tweet.get('favorited', False),
+        tweet.get('retweeted', False),
+        tweet.get('favorite_count', 0),
+        tweet.get('retweet_count', 0),
+        user_record(tweet['user']),
+    )
+
+
+class RecordParser(ModelParser):
+    """Parser of tweepy.API that turns statuses and users into records
+
+    Other payloads(ids, json etc.) are parsed into tweepy models as usual.
+    Search results are a plain list of TweetRecord.
+    """
+    RECORDS = {
+        'status': tweet_record,
+        'search_results': tweet_record,
+        'user': user_record,
+    }
+
+    def parse(self, method, payload):
+        to_record = self.RECORDS.get(method.payload_type)
+        if to_record is None:
+            return super().parse(method, payload)
+
+        try:
+            data = loads(payload)
+        except Exception as e:
+            raise TweepError(f'Failed to parse JSON payload: {e}')
+        if method.payload_type == 'search_results':
+            data = data['statuses']
+        elif not method.payload_list:
+            return to_record(data)
+        return [to_record(item) for item in data]
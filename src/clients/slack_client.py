@@ -1,6 +1,23 @@
+import atexit
+from queue import Empty, Queue
+from threading import Lock, Thread
+import time
+from typing import List, Optional
+
 import requests
 
 from .mixins import SlackCredentialMixin
+from utils import (
+    SLACK_COALESCE_INTERVAL_IN_SECOND,
+    SLACK_MIN_INTERVAL_IN_SECOND,
+    SLACK_MESSAGE_MAX_LENGTH,
+    SLACK_FLUSH_TIMEOUT_IN_SECOND,
+    SLACK_API_URL,
+    RETRY_NUM,
+)
+
+# Shared by every channel so that connections to slack are kept alive
+SESSION = requests.Session()
 
 
 class SlackBase:
@@ -8,24 +25,115 @@ class SlackBase:
 
 
 class SlackClient(SlackBase, SlackCredentialMixin):
+    """Post messages to a slack channel
+
+    Messages are queued and sent by a background thread. Messages queued within
+    SLACK_COALESCE_INTERVAL_IN_SECOND are joined into one post, and posts to a
+    channel are at least SLACK_MIN_INTERVAL_IN_SECOND apart. When immediate is
+    True, messages are posted right away from the calling thread instead.
+    """
+
+    def __init__(self, channel: str, immediate: bool = False):
+        super().__init__(channel)
+        self._immediate = immediate
+        self._queue: Queue = Queue()
+        self._worker: Optional[Thread] = None
+        # Guards the worker and _previous_post, which both the worker and immediate callers touch
+        self._lock = Lock()
+        self._previous_post: float = 0
+        atexit.register(self.flush)
 
     def send_message(self, message):
+        if self._immediate:
+            self._post(str(message))
+            return
+        self._queue.put(str(message))
+        self._start_worker()
+
+    def flush(self, timeout: float = SLACK_FLUSH_TIMEOUT_IN_SECOND) -> None:
+        """Wait until queued messages have been posted
+
+        Args:
+            timeout: seconds to give up after
+
+        """
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks > 0 and time.time() < deadline:
+            time.sleep(0.05)
+
+    def _start_worker(self) -> None:
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = Thread(target=self._work, name=f'slack{self._channel}', daemon=True)
+            self._worker.start()
+
+    def _work(self) -> None:
+        while True:
+            messages: List[str] = [self._queue.get()]
+            deadline = time.time() + SLACK_COALESCE_INTERVAL_IN_SECOND
+            while True:
+                try:
+                    messages.append(self._queue.get(timeout=max(deadline - time.time(), 0)))
+                except Empty:
+                    break
+            try:
+                for digest in self._digests(messages):
+                    self._post(digest)
+            except Exception as e:
+                # The worker must survive so that later messages are still sent
+                self._report_failure(e)
+            finally:
+                for _ in messages:
+                    self._queue.task_done()
+
+    def _report_failure(self, e: Exception) -> None:
+        try:
+            SLACK_ERROR.send_message(f'ERROR: Failed to post to slack{self._channel}: {e}')
+        except Exception:
+            # Slack cannot be reached at all, so there is nowhere left to report to
+            pass
+
+    @staticmethod
+    def _digests(messages: List[str]) -> List[str]:
+        digests: List[str] = []
+        for message in messages:
+            if len(digests) != 0 and len(digests[-1]) + len(message) + 1 <= SLACK_MESSAGE_MAX_LENGTH:
+                digests[-1] = f'{digests[-1]}\n{message}'
+            else:
+                digests.append(message)
+        return digests
+
+    def _post(self, message: str) -> None:
         params = {
             'token': self._token,
             'channel': self._channel,
             'text': message
         }
 
-        res = requests.post(
-            'https://slack.com/api/chat.postMessage',
-            headers=self._headers,
-            params=params
-        )
-        if not res.json().get('ok'):
-            # TODO
-            print('add logging here')
+        for _ in range(RETRY_NUM):
+            # The slot is reserved under the lock and waited for outside of it
+            with self._lock:
+                slot = max(self._previous_post + SLACK_MIN_INTERVAL_IN_SECOND, time.time())
+                self._previous_post = slot
+            wait_in_sec = slot - time.time()
+            if wait_in_sec > 0:
+                time.sleep(wait_in_sec)
+            res = SESSION.post(
+                SLACK_API_URL,
+                headers=self._headers,
+                params=params
+            )
+            if res.status_code == 429:
+                # https://api.slack.com/docs/rate-limits
+                time.sleep(int(res.headers.get('Retry-After', 1)))
+                continue
+            if not res.json().get('ok'):
+                # TODO
+                print('add logging here')
+            return
 
 
 SLACK_INFO = SlackClient('#twitter_bot_info')
 SLACK_WARNING = SlackClient('#twitter_bot_warning')
-SLACK_ERROR = SlackClient('#twitter_bot_error')
+SLACK_ERROR = SlackClient('#twitter_bot_error', immediate=True)
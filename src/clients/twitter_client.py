@@ -1,19 +1,22 @@
-import time
-from typing import Optional, Set
+from typing import Iterator, List, Optional, Set, Tuple
 
-import tweepy
 from tweepy import models
-from tweepy.error import RateLimitError, TweepError
+from tweepy.error import TweepError
 
+from .errors import LikeLimitExceeded, NoResponseError
 from .mixins import TwitterCredentialMixin
+from .profiles import (
+    SEARCH,
+    TIMELINE,
+    with_profile,
+)
 from .utils import prevent_from_limit_error
 from .slack_client import (
     SLACK_WARNING,
     SLACK_ERROR,
 )
 from utils import (
-    RETRY_NUM,
-    REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND,
+    USERS_LOOKUP_LIMIT,
 )
 
 
@@ -25,21 +28,31 @@ class TwitterClient(
     TwitterBase,
     TwitterCredentialMixin
 ):
+    """Endpoints of twitter the bot uses
+
+    Statuses and users are returned as TweetRecord and UserRecord(clients/records.py)
+    while LEAN_TWITTER_RESPONSES is True, and as tweepy models otherwise.
+    Rate limit errors are retried by prevent_from_limit_error once the window resets.
+    """
 
     @prevent_from_limit_error(
         'search',
         '/search/tweets',
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
+        window_in_sec=15 * 60
     )
+    @with_profile(SEARCH)
     def fetch_tweets_by_keyword(self, **kwargs):
         """
 
         Args:
+            profile (RequestProfile): parameters that trim the response. SEARCH by default.
             **kwargs:
 
         Returns:
 
+        Raises:
+            NoResponseError: twitter could not be reached
+
         Examples:
             TODO Fix the annotation
             >>>search_results: models.SearchResults[models.Status] = LikeBot().fetch_tweets_by_keyword(q='python', lang='ja', count=100)
@@ -55,33 +68,24 @@ class TwitterClient(
             kwargs['lang'] = 'ja'
         if 'count' not in kwargs.keys():
             kwargs['count'] = 100
-        for _ in range(RETRY_NUM):
-            try:
-                return self.api.search(**kwargs)
-            except RateLimitError:
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
+        try:
+            return self.api.search(**kwargs)
+        except TweepError as e:
+            if e.response is None:
                 SLACK_WARNING.send_message(
-                    (
-                        'WARNING: Rate limit error occurred in fetch_tweets_by_keyword'
-                        'Sleep for 15min..zzzz'
-                    )
+                    f'WARNING: None response received in fetch_tweets_by_keyword.'
                 )
-                continue
-            except TweepError as e:
-                if e.response is None:
-                    SLACK_WARNING.send_message(
-                        f'WARNING: None response received in fetch_tweets_by_keyword.'
-                    )
-                    SLACK_WARNING.send_message(
-                        f'Reason is {e.reason}'
-                    )
-                    return []
-                raise
+                SLACK_WARNING.send_message(
+                    f'Reason is {e.reason}'
+                )
+                raise NoResponseError(e.reason) from e
+            raise
 
     @prevent_from_limit_error(
+        'favorites',
+        '/favorites/create',
         request_limit=15,
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
+        window_in_sec=15 * 60
     )
     def like_tweet(self, **kwargs):
         """
@@ -90,53 +94,94 @@ class TwitterClient(
             **kwargs:
 
         Returns:
+            status liked or None if twitter refused it as already liked or deleted
+
+        Raises:
+            LikeLimitExceeded: likes are locked out by 429
+            NoResponseError: twitter could not be reached, so whether it was liked is unknown
 
         Notes:
             Requests / 24-hour window	1000 per user; 1000 per app
             https://developer.twitter.com/en/docs/tweets/post-and-engage/api-reference/post-favorites-create
         """
-        for _ in range(RETRY_NUM):
-            try:
-                return self.api.create_favorite(**kwargs)
-            except TweepError as e:
-                if e.response is None:
-                    SLACK_WARNING.send_message(
-                        f'WARNING: None response received in like_tweet.'
-                    )
-                    SLACK_WARNING.send_message(
-                        f'Reason is {e.reason}'
-                    )
-                    return None
-                if e.response.status_code == 403:
-                    # TODO: Should either get all of my favourites or save them in db.
-                    SLACK_WARNING.send_message(
-                        (
-                            'WARNING: This tweet has been liked.'
-                        )
-                    )
-                    return
-                elif e.response.status_code == 404:
-                    SLACK_WARNING.send_message(
-                        (
-                            'WARNING: This tweet has been deleted'
-                        )
+        try:
+            return self.api.create_favorite(**kwargs)
+        except TweepError as e:
+            if e.response is None:
+                SLACK_WARNING.send_message(
+                    f'WARNING: None response received in like_tweet.'
+                )
+                SLACK_WARNING.send_message(
+                    f'Reason is {e.reason}'
+                )
+                raise NoResponseError(e.reason) from e
+            if e.response.status_code == 403:
+                # TODO: Should either get all of my favourites or save them in db.
+                SLACK_WARNING.send_message(
+                    (
+                        'WARNING: This tweet has been liked.'
                     )
-                    return
-                elif e.response.status_code == 429:
-                    SLACK_ERROR.send_message(
-                        (
-                            "Like request limit has been exceeded. Let's sleep 24hours"
-                        )
+                )
+                return
+            elif e.response.status_code == 404:
+                SLACK_WARNING.send_message(
+                    (
+                        'WARNING: This tweet has been deleted'
                     )
-                    time.sleep(24 * 60 * 60)
-                    return
-                raise
+                )
+                return
+            elif e.response.status_code == 429:
+                # Only likes are locked out, so the caller parks likes and the other endpoints keep going
+                reset = e.response.headers.get('x-rate-limit-reset')
+                raise LikeLimitExceeded(float(reset) if reset else None) from e
+            raise
+
+    def fetch_favorite_tweet_ids(self, max_pages: int) -> List[int]:
+        """Fetch ids of tweets that have been liked by the authenticated user
+
+        Args:
+            max_pages: number of pages(200 tweets each) to fetch at most
+
+        Returns:
+            Tweet ids from the newest
+
+        Notes:
+            https://developer.twitter.com/en/docs/tweets/post-and-engage/api-reference/get-favorites-list
+        """
+        ids: List[int] = []
+        max_id: Optional[int] = None
+        for _ in range(max_pages):
+            kwargs = {'count': 200} if max_id is None else {'count': 200, 'max_id': max_id}
+            tweets = self._fetch_favorites(**kwargs)
+            if len(tweets) == 0:
+                break
+            ids.extend(tweet.id for tweet in tweets)
+            max_id = tweets[-1].id - 1
+        return ids
+
+    @prevent_from_limit_error(
+        'favorites',
+        '/favorites/list',
+        window_in_sec=15 * 60
+    )
+    def _fetch_favorites(self, **kwargs) -> List[models.Status]:
+        try:
+            return self.api.favorites(**kwargs)
+        except TweepError as e:
+            if e.response is None:
+                SLACK_WARNING.send_message(
+                    f'WARNING: None response received in fetch_favorite_tweet_ids.'
+                )
+                SLACK_WARNING.send_message(
+                    f'Reason is {e.reason}'
+                )
+                return []
+            raise e
 
     @prevent_from_limit_error(
         'users',
         '/users/show/:id',
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
+        window_in_sec=15 * 60
     )
     def fetch_user_info(self, **kwargs) -> Optional[models.User]:
         """
@@ -145,109 +190,181 @@ class TwitterClient(
             **kwargs:
 
         Returns:
+            User or None if the user is protected
+
+        Raises:
+            NoResponseError: twitter could not be reached
 
         Notes:
             api docs
         """
-        for _ in range(RETRY_NUM):
-            try:
-                return self.api.get_user(**kwargs)
-            except RateLimitError:
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
+        try:
+            return self.api.get_user(**kwargs)
+        except TweepError as e:
+            if e.response is None:
                 SLACK_WARNING.send_message(
-                    (
-                        'WARNING: Rate limit error occurred in fetch_user_info'
-                        'Sleep for 15min..zzzz'
-                    )
+                    f'WARNING: None response received in fetch_user_info.'
                 )
-                continue
-            except TweepError as e:
-                if e.response is None:
-                    SLACK_WARNING.send_message(
-                        f'WARNING: None response received in fetch_user_info.'
-                    )
-                    SLACK_WARNING.send_message(
-                        f'Reason is {e.reason}'
-                    )
-                    return None
-                if e.response.status_code == 401:
-                    """Not Authorized(protected account)"""
-                    SLACK_WARNING.send_message(f'WARNING: This user is protected{str(kwargs)}')
-                    return None
-                raise e
+                SLACK_WARNING.send_message(
+                    f'Reason is {e.reason}'
+                )
+                raise NoResponseError(e.reason) from e
+            if e.response.status_code == 401:
+                """Not Authorized(protected account)"""
+                SLACK_WARNING.send_message(f'WARNING: This user is protected{str(kwargs)}')
+                return None
+            raise e
+
+    def fetch_users_bulk(self, ids: List[int]) -> Tuple[List[models.User], List[int]]:
+        """Fetch user info of ids with as few requests as possible
+
+        Args:
+            ids: user ids to fetch
+
+        Returns:
+            Users that were found and ids whose request got no response.
+            Missing or suspended ids are in neither and the order of users is not guaranteed.
+
+        Notes:
+            users/lookup returns up to 100 users per request and has its own
+            rate limit, unlike users/show that returns only one.
+            https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-users-lookup
+        """
+        users: List[models.User] = []
+        failed_ids: List[int] = []
+        for idx in range(0, len(ids), USERS_LOOKUP_LIMIT):
+            chunk = ids[idx:idx + USERS_LOOKUP_LIMIT]
+            try:
+                users.extend(self._lookup_users(chunk))
+            except NoResponseError:
+                failed_ids.extend(chunk)
+        return users, failed_ids
 
     @prevent_from_limit_error(
-        'statuses',
-        '/statuses/user_timeline',
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
+        'users',
+        '/users/lookup',
+        window_in_sec=15 * 60
     )
-    def fetch_user_tweet(self, **kwargs) -> Optional[models.User]:
+    def _lookup_users(self, ids: List[int]) -> List[models.User]:
+        try:
+            return self.api.lookup_users(user_ids=ids)
+        except TweepError as e:
+            if e.response is None:
+                SLACK_WARNING.send_message(
+                    f'WARNING: None response received in fetch_users_bulk.'
+                )
+                SLACK_WARNING.send_message(
+                    f'Reason is {e.reason}'
+                )
+                raise NoResponseError(e.reason) from e
+            if e.response.status_code == 404:
+                """None of ids exist"""
+                return []
+            raise e
+
+    def fetch_user_tweet(self, **kwargs) -> Optional[List[models.Status]]:
         """
 
         Args:
+            profile (RequestProfile): parameters that trim the response. TIMELINE by default.
             **kwargs:
 
         Returns:
+            Tweets of the user or None if the user is protected or twitter could not be reached
 
         Notes:
             api docs
         """
-        for _ in range(RETRY_NUM):
-            try:
-                return self.api.user_timeline(**kwargs)
-            except RateLimitError:
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
-                SLACK_WARNING.send_message('WARNING: Rate limit error occurred! Sleep for 15min..zzzz')
-                continue
-            except TweepError as e:
-                if e.response is None:
-                    SLACK_WARNING.send_message(
-                        f'WARNING: None response received in fetch_user_tweet.'
-                    )
-                    SLACK_WARNING.send_message(
-                        f'Reason is {e.reason}'
-                    )
-                    return None
-                if e.response.status_code == 401:
-                    """Not Authorized(protected account)"""
-                    SLACK_WARNING.send_message(f'WARNING: This user is protected{str(kwargs)}')
-                    return None
-                raise e
+        try:
+            return self.fetch_user_timeline(**kwargs)
+        except NoResponseError:
+            return None
 
     @prevent_from_limit_error(
-        'followers',
-        '/followers/ids',
-        window_in_sec=15 * 60,
-        recovery_time_in_sec=15 * 60
+        'statuses',
+        '/statuses/user_timeline',
+        window_in_sec=15 * 60
     )
+    @with_profile(TIMELINE)
+    def fetch_user_timeline(self, **kwargs) -> Optional[List[models.Status]]:
+        """fetch_user_tweet that tells a request without response from a protected user
+
+        Returns:
+            Tweets of the user or None if the user is protected
+
+        Raises:
+            NoResponseError: twitter could not be reached
+        """
+        try:
+            return self.api.user_timeline(**kwargs)
+        except TweepError as e:
+            if e.response is None:
+                SLACK_WARNING.send_message(
+                    f'WARNING: None response received in fetch_user_tweet.'
+                )
+                SLACK_WARNING.send_message(
+                    f'Reason is {e.reason}'
+                )
+                raise NoResponseError(e.reason) from e
+            if e.response.status_code == 401:
+                """Not Authorized(protected account)"""
+                SLACK_WARNING.send_message(f'WARNING: This user is protected{str(kwargs)}')
+                return None
+            raise e
+
     def fetch_user_follower_ids(self, user_id: str) -> Set[int]:
-        followers_ids_iter = tweepy.Cursor(self.api.followers_ids, id=user_id).pages()
         all_ids: Set[int] = set()
-        while True:
-            try:
-                ids = next(followers_ids_iter)
-            except RateLimitError:
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
-                SLACK_WARNING.send_message('WARNING: Rate limit error occurred! Sleep for 15min..zzzz')
-                continue
-            except StopIteration:
-                break
-            except TweepError as e:
-                if e.response is None:
-                    SLACK_WARNING.send_message(
-                        f'WARNING: None response received in fetch_user_follower_ids.'
-                    )
-                    SLACK_WARNING.send_message(
-                        f'Reason is {e.reason}'
-                    )
-                    return all_ids
-                if e.response.status_code == 401:
-                    """ID that does not exist"""
-                    SLACK_ERROR.send_message(f'ID:{user_id} does not exist')
-                raise e
+        for ids, _ in self.iter_user_follower_id_pages(user_id):
+            all_ids.update(ids)
+        return all_ids
 
-            for id_ in ids:
-                all_ids.add(id_)
+    def iter_user_follower_id_pages(
+            self,
+            user_id: str,
+            cursor: int = -1
+    ) -> Iterator[Tuple[List[int], int]]:
+        """Yield follower ids page by page as they arrive
 
-        return all_ids
+        Args:
+            user_id: user to fetch followers of
+            cursor: cursor to start from. -1 is the first page.
+
+        Returns:
+            Iterator of (ids, next_cursor). next_cursor is 0 on the last page.
+
+        Notes:
+            Up to 5000 ids are returned per page.
+            https://developer.twitter.com/en/docs/accounts-and-users/follow-search-get-users/api-reference/get-followers-ids
+        """
+        while cursor != 0:
+            page = self._fetch_follower_id_page(user_id, cursor)
+            if page is None:
+                return
+            ids, (_, cursor) = page
+            yield ids, cursor
+
+    @prevent_from_limit_error(
+        'followers',
+        '/followers/ids',
+        window_in_sec=15 * 60
+    )
+    def _fetch_follower_id_page(
+            self,
+            user_id: str,
+            cursor: int
+    ) -> Optional[Tuple[List[int], Tuple[int, int]]]:
+        try:
+            return self.api.followers_ids(id=user_id, cursor=cursor)
+        except TweepError as e:
+            if e.response is None:
+                SLACK_WARNING.send_message(
+                    f'WARNING: None response received in fetch_user_follower_ids.'
+                )
+                SLACK_WARNING.send_message(
+                    f'Reason is {e.reason}'
+                )
+                return None
+            if e.response.status_code == 401:
+                """ID that does not exist"""
+                SLACK_ERROR.send_message(f'ID:{user_id} does not exist')
+            raise e
@@ -1,8 +1,11 @@
-from datetime import datetime
+import asyncio
 from functools import wraps
+from threading import Lock
 import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
 
-from tweepy.error import RateLimitError
+from tweepy.error import RateLimitError, TweepError
 
 from .slack_client import (
     SLACK_WARNING,
@@ -11,80 +14,38 @@ from .mixins import TwitterCredentialMixin as Twitter
 from utils import (
     RETRY_NUM,
     REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND,
+    RATE_LIMIT_WAIT_NOTIFICATION_IN_SECOND,
 )
 
 
-def prevent_from_limit_error(
-        *args_,
-        request_limit: int = 15,
-        window_in_sec: int = 15 * 60,
-        recovery_time_in_sec: int = 15 * 60
-):
-    def decorator(func):
-        cache = {}
-
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            elapsed = time.time() - cache['previous_call']
-            is_too_soon = elapsed < window_in_sec
-            is_too_many = cache['num_called'] >= cache['remaining']
-            is_exceeded_request_limit: bool = is_too_soon and is_too_many
-            if is_exceeded_request_limit:
-                now_in_unix = datetime.now().timestamp()
-                recovery_time_in_sec_ = fetch_request_limit(*args_)['reset'] - now_in_unix \
-                    if len(args_) != 0 else recovery_time_in_sec
-
-                SLACK_WARNING.send_message(
-                    (
-                        f'Too many requests for {func.__name__}'
-                        f"let's sleep {recovery_time_in_sec_} seconds."
-                    )
-                )
-                time.sleep(recovery_time_in_sec_)
-                cache['num_called'] = 0
-            cache['previous_call'] = time.time()
-            cache['num_called'] += 1
-            cache['remaining'] = cache['request_limit'] - cache['num_called']
-            print(f'{func.__name__}_cache_inside: {cache}')
-            return func(*args, **kwargs)
-
-        cache = {
-            'num_called': 0,
-            'previous_call': time.time(),
-            'request_limit': fetch_request_limit(*args_)['limit'] if len(args_) != 0 else request_limit,
-            'remaining': fetch_request_limit(*args_)['remaining'] if len(args_) != 0 else request_limit,
-        }
-        print(f'{func.__name__}_cache_outside: {cache}')
-        return wrapper
+class RateLimitStatus:
+    """Snapshot of rate_limit_status that seeds the bucket of every decorated endpoint
 
-    def fetch_request_limit(*args):
-        """
+    Nothing is fetched until the first lookup, so importing clients makes no
+    network calls. It is fetched only once, since buckets follow the headers of
+    responses after that.
+    """
 
-        Returns:
+    def __init__(self):
+        self._status: Optional[Dict[str, Any]] = None
+        self._lock = Lock()
+        self._twitter: Optional[Twitter] = None
 
-        Notes:
-            API Document xxx
+    def get(self, *args: str) -> Optional[Dict[str, Any]]:
+        """Return rate limit of an endpoint
 
-        """
+        Args:
+            *args: path to the endpoint in resources. e.g. 'search', '/search/tweets'
 
-        for _ in range(RETRY_NUM):
-            try:
-                status = Twitter().api.rate_limit_status()
-            except RateLimitError:
-                SLACK_WARNING.send_message(
-                    (
-                        'WARNING: Woops Rate limit (fetch_request_limit_remaining in Base) '
-                        'error occurred! Sleep for 15min..zzzz'
-                    )
-                )
-                time.sleep(REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND)
-                continue
-            break
+        Returns:
+            {'limit': int, 'remaining': int, 'reset': int} or None if the endpoint is unknown
 
-        if len(args) == 0:
-            return status
+        """
+        if self._status is None:
+            self.refresh()
 
-        outer = status.get('resources', {})
+        outer = (self._status or {}).get('resources', {})
+        inner = None
         for target in args:
             inner = outer.get(target, None)
             if inner is None:
@@ -92,4 +53,213 @@ def prevent_from_limit_error(
             outer = inner
         return inner
 
+    def refresh(self) -> None:
+        """Fetch rate_limit_status and replace the snapshot
+
+        Notes:
+            API Document https://developer.twitter.com/en/docs/developer-utilities/rate-limit-status/api-reference/get-application-rate_limit_status
+            If it cannot be fetched, the snapshot is left empty and buckets start full.
+        """
+        with self._lock:
+            if self._twitter is None:
+                self._twitter = Twitter()
+            twitter = self._twitter
+
+        try:
+            status = twitter.api.rate_limit_status()
+        except TweepError as e:
+            SLACK_WARNING.send_message(
+                f'WARNING: Could not fetch rate_limit_status. Buckets start full. Reason is {e.reason}'
+            )
+            status = {}
+        with self._lock:
+            self._status = status
+
+
+RATE_LIMIT_STATUS = RateLimitStatus()
+
+
+class RateLimitBucket:
+    """Requests left for an endpoint in the current rate limit window
+
+    limit, remaining and reset are overwritten by x-rate-limit-* headers of
+    every response, so waits last exactly until the reset Twitter reports.
+    Until the first response, they are seeded from RATE_LIMIT_STATUS.
+    """
+
+    def __init__(self, endpoint: str, limit: int, window_in_sec: float, *resource_path: str):
+        self.endpoint = endpoint
+        self.limit = limit
+        self.window_in_sec = window_in_sec
+        self.remaining: Optional[int] = None
+        self.reset: float = 0
+        self._window_start: float = 0
+        self._resource_path = resource_path
+        self._lock = Lock()
+
+    def _seed(self, now: float) -> None:
+        status = RATE_LIMIT_STATUS.get(*self._resource_path) if len(self._resource_path) != 0 else None
+        if status is None or status['reset'] <= now:
+            self.remaining = self.limit
+            self.reset = now + self.window_in_sec
+        else:
+            self.limit = status['limit']
+            self.remaining = status['remaining']
+            self.reset = status['reset']
+        self._window_start = now
+
+    def reserve(self) -> float:
+        """Take a request from the bucket
+
+        Returns:
+            Seconds to wait before sending the request
+
+        """
+        with self._lock:
+            now = time.time()
+            if self.remaining is None:
+                self._seed(now)
+            if now >= self.reset:
+                self.remaining = self.limit
+                self._window_start = now
+                self.reset = now + self.window_in_sec
+            if self.remaining <= 0:
+                # Borrow from the next window which starts at reset
+                self._window_start = self.reset
+                self.reset = self.reset + self.window_in_sec
+                self.remaining = self.limit
+            self.remaining -= 1
+            return max(self._window_start - now, 0)
+
+    def acquire(self) -> None:
+        """Block until a request can be sent"""
+        wait_in_sec = self.reserve()
+        if wait_in_sec > RATE_LIMIT_WAIT_NOTIFICATION_IN_SECOND:
+            SLACK_WARNING.send_message(
+                f"Too many requests for {self.endpoint} let's sleep {int(wait_in_sec)} seconds."
+            )
+        if wait_in_sec > 0:
+            time.sleep(wait_in_sec)
+
+    async def acquire_async(self) -> None:
+        """Wait without blocking the event loop until a request can be sent"""
+        wait_in_sec = self.reserve()
+        if wait_in_sec > 0:
+            await asyncio.sleep(wait_in_sec)
+
+    def exhaust(self) -> None:
+        """Use up the current window after twitter answered that the limit has been hit
+
+        The next request waits until reset. If reset has already passed, e.g. twitter
+        told nothing about it, it waits REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND.
+        """
+        with self._lock:
+            now = time.time()
+            if self.reset <= now:
+                self.reset = now + REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND
+            self.remaining = 0
+
+    def update(self, limit: int, remaining: int, reset: float) -> None:
+        with self._lock:
+            if reset < self._window_start:
+                # Response of a window that has already been left behind
+                return
+            self.limit = limit
+            self.remaining = remaining
+            self.reset = reset
+            self._window_start = min(self._window_start, time.time())
+
+
+class RateLimitRegistry:
+    """Rate limit buckets keyed by endpoint e.g. '/search/tweets'"""
+
+    # Paths of responses that differ from the endpoint names in rate_limit_status
+    ENDPOINT_ALIASES = {
+        '/users/show': '/users/show/:id',
+    }
+
+    def __init__(self):
+        self._buckets: Dict[str, RateLimitBucket] = {}
+        self._lock = Lock()
+
+    def get(self, endpoint: str, limit: int, window_in_sec: float, *resource_path: str) -> RateLimitBucket:
+        with self._lock:
+            if endpoint not in self._buckets:
+                self._buckets[endpoint] = RateLimitBucket(endpoint, limit, window_in_sec, *resource_path)
+            return self._buckets[endpoint]
+
+    def update_from_response(self, response) -> None:
+        """Update the bucket of the endpoint that response came from
+
+        Args:
+            response: requests.Response returned by twitter
+
+        """
+        if response is None:
+            return
+        headers = response.headers
+        if 'x-rate-limit-remaining' not in headers or 'x-rate-limit-reset' not in headers:
+            return
+        path = urlparse(response.url).path
+        path = path[len('/1.1'):] if path.startswith('/1.1/') else path
+        path = path[:-len('.json')] if path.endswith('.json') else path
+        endpoint = self.ENDPOINT_ALIASES.get(path, path)
+        with self._lock:
+            bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            return
+        bucket.update(
+            int(headers.get('x-rate-limit-limit', bucket.limit)),
+            int(headers['x-rate-limit-remaining']),
+            float(headers['x-rate-limit-reset']),
+        )
+
+
+RATE_LIMITS = RateLimitRegistry()
+
+
+def prevent_from_limit_error(
+        *args_,
+        request_limit: int = 15,
+        window_in_sec: int = 15 * 60
+):
+    """Wait for the rate limit of the endpoint before calling the decorated method
+
+    Args:
+        *args_: path to the endpoint in rate_limit_status. e.g. 'search', '/search/tweets'
+            The last one is used as the endpoint name.
+        request_limit: requests per window used until the actual limit is known
+        window_in_sec: length of the rate limit window
+
+    Notes:
+        The decorated method has to be a method of a client with api(CapturingAPI).
+        The response of every call is read from api.last_response of the calling thread
+        to keep the bucket in sync.
+        RateLimitError is retried up to RETRY_NUM times, each waiting for the reset of
+        the bucket and taking a request from it. The last one is raised.
+    """
+    def decorator(func):
+        endpoint = args_[-1] if len(args_) != 0 else func.__name__
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            bucket = RATE_LIMITS.get(endpoint, request_limit, window_in_sec, *args_)
+            for num_tries in range(1, RETRY_NUM + 1):
+                bucket.acquire()
+                self.api.last_response = None
+                try:
+                    return func(self, *args, **kwargs)
+                except RateLimitError:
+                    bucket.exhaust()
+                    SLACK_WARNING.send_message(
+                        f'WARNING: Rate limit error occurred in {func.__name__}. '
+                        f'Wait until {endpoint} resets..zzzz'
+                    )
+                    if num_tries == RETRY_NUM:
+                        raise
+                finally:
+                    RATE_LIMITS.update_from_response(self.api.last_response)
+
+        return wrapper
+
     return decorator
@@ -1,24 +1,86 @@
-from dataclasses import dataclass
-from typing import List, Iterable, Union
-
-from sqlalchemy.orm import sessionmaker
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Dict, List, Iterable, Iterator, Optional, Tuple, Union
+
+from sqlalchemy.orm import Session
 from tweepy.models import User as user_account
 
-from utils import ENGINE
+from utils import (
+    session_scope,
+    EXISTENCE_CHECK_CHUNK_SIZE,
+    BULK_INSERT_CHUNK_SIZE,
+    THREADS_PER_LOGIC,
+)
 from clients import TwitterClient
-from models import ValuableUsers
+from models import (
+    ValuableUserRepository,
+    insert_users_ignoring_existing,
+)
 from .evaluate import Evaluate
 
 
 @dataclass
 class LogicBase:
     twitter = TwitterClient()
-    evaluate = Evaluate()
+    # Evaluate keeps caches of the user being evaluated, so each logic has its own
+    evaluate: Evaluate = field(default_factory=Evaluate)
+    # Each logic has its own threads so that one waiting for its quota does not stall others
+    executor: ThreadPoolExecutor = field(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=THREADS_PER_LOGIC),
+        repr=False
+    )
+    user_repository: ValuableUserRepository = field(default_factory=ValuableUserRepository, repr=False)
+
+    @staticmethod
+    def iter_chunks_of_users(
+            users: Iterable[Union[int, user_account]],
+            chunk_size: int
+    ) -> Iterator[Tuple[List[int], List[Union[int, user_account]]]]:
+        """Yield (ids, users) of chunk_size users at a time"""
+        users_iter = iter(users)
+        while True:
+            chunk: List[Union[int, user_account]] = list(islice(users_iter, chunk_size))
+            if len(chunk) == 0:
+                return
+            yield [id_ if isinstance(id_, int) else id_.id for id_ in chunk], chunk
+
+    @staticmethod
+    def user_rows(target_all: List[user_account], num_likes: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                'id': new_account.id,
+                'screen_name': new_account.name,
+                'is_friend': new_account.following,
+                'num_likes': num_likes,
+            }
+            for new_account in target_all
+        ]
+
+    async def fetch_users_not_in_database(
+            self,
+            users: Iterable[Union[int, user_account]],
+            chunk_size: int = EXISTENCE_CHECK_CHUNK_SIZE
+    ) -> List[Union[int, user_account]]:
+        """Return users that are not in db, keeping the order of users
 
-    @property
-    def get_session(self):
-        session = sessionmaker(bind=ENGINE)
-        return session()
+        Args:
+            users: user ids or user accounts to check
+            chunk_size: number of ids to check per query
+
+        Notes:
+            Queries run on the asyncpg pool, so the event loop is free while waiting for them.
+        """
+        users_not_in_db: List[Union[int, user_account]] = []
+        for chunk_ids, chunk in self.iter_chunks_of_users(users, chunk_size):
+            existing_ids = await self.user_repository.fetch_existing_ids(chunk_ids)
+            users_not_in_db.extend(
+                user for id_, user in zip(chunk_ids, chunk)
+                if id_ not in existing_ids
+            )
+        return users_not_in_db
 
     def filter_by_existence_in_database(
             self,
@@ -31,46 +93,56 @@ class LogicBase:
 
         Returns:
 
+        Notes:
+            Thin wrapper of fetch_users_not_in_database for worker threads.
         """
-        session = self.get_session
-        filtered_ids: List[Union[int, user_account]] = []
-        for id_ in users:
-            if isinstance(id_, int):
-                user_in_db = session.query(ValuableUsers).filter(ValuableUsers.user_id == id_).first()
-            else:
-                # TODO: fix this later
-                user_in_db = session.query(ValuableUsers).filter(ValuableUsers.user_id == id_.id).first()
-            if user_in_db is not None:
-                continue
-            filtered_ids.append(id_)
-        session.close()
-        return filtered_ids
-
-    def save_new_users(self, target_all: List[user_account], num_likes: int = 0) -> None:
+        return self.user_repository.database.wait(self.fetch_users_not_in_database(users))
+
+    def save_new_users(
+            self,
+            target_all: List[user_account],
+            num_likes: int = 0,
+            session: Optional[Session] = None
+    ) -> int:
         """Save users in target_all
 
         Args:
             target_all (user_account): Target  users to save in db
             num_likes (int): number of likes to save
+            session (Session): session shared by the caller, which commits it.
+                Without it, this is a thin wrapper of save_new_users_async.
+
+        Returns:
+            Number of users that were actually inserted
 
         Notes:
             table: user_id(integer) screen_name(str) is_friend(boolean) num_likes(int)
+            Users already in db are skipped by ON CONFLICT DO NOTHING.
         """
-        session = self.get_session
-        new_accounts: List[user_account] = self.filter_by_existence_in_database(target_all)
-        for new_account in new_accounts:
-            screen_name: str = new_account.name
-            id_: int = new_account.id
-            is_friend: bool = new_account.following
-            vu = ValuableUsers(
-                user_id=id_,
-                screen_name=screen_name,
-                is_friend=is_friend,
-                num_likes=num_likes
-            )
-            session.add(vu)
-        session.commit()
-        session.close()
+        if session is None:
+            return self.user_repository.database.wait(self.save_new_users_async(target_all, num_likes))
+        num_inserted = 0
+        for idx in range(0, len(target_all), BULK_INSERT_CHUNK_SIZE):
+            rows = self.user_rows(target_all[idx:idx + BULK_INSERT_CHUNK_SIZE], num_likes)
+            num_inserted += insert_users_ignoring_existing(session, rows)
+        return num_inserted
+
+    async def save_new_users_async(self, target_all: List[user_account], num_likes: int = 0) -> int:
+        """Save users in target_all on the asyncpg pool
+
+        Args:
+            target_all: Target users to save in db
+            num_likes: number of likes to save
+
+        Returns:
+            Number of users that were actually inserted
+
+        """
+        num_inserted = 0
+        for idx in range(0, len(target_all), BULK_INSERT_CHUNK_SIZE):
+            rows = self.user_rows(target_all[idx:idx + BULK_INSERT_CHUNK_SIZE], num_likes)
+            num_inserted += await self.user_repository.insert_ignoring_existing(rows)
+        return num_inserted
 
     def update_db(self, model_object, *, search_key: str, **kwargs) -> None:
         """Update object
@@ -81,13 +153,26 @@ class LogicBase:
             kwargs (Dict[str, Any]): things to update key: column name value: value to update
 
         """
-        session = self.get_session
         search_ = getattr(model_object, search_key)
-        model_ = session.query(model_object).filter(search_ == kwargs[search_key]).first()
-        for k, v in kwargs.items():
-            setattr(model_, k, v)
-        session.commit()
-        session.close()
+        with session_scope() as session:
+            model_ = session.query(model_object).filter(search_ == kwargs[search_key]).first()
+            for k, v in kwargs.items():
+                setattr(model_, k, v)
+
+    async def run_in_thread(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run blocking func(twitter, slack, db calls) without blocking the event loop
+
+        Args:
+            func: blocking function to run
+            *args: args of func
+            **kwargs: kwargs of func
+
+        Returns:
+            Return value of func
+
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
 
     @classmethod
     async def main(cls, *args, **kwargs):
@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from models.user_verdicts import (
+    VALUABLE,
+    NOT_VALUABLE,
+    PROTECTED,
+)
+
+# Rules in the order Evaluate checks them. A rejected user is counted by the first rule it fails.
+RULES = ('followers', 'friends', 'favourites', 'protected', 'description', 'business', 'inactive')
+USER_FIELDS = ('id', 'followers', 'friends', 'favourites', 'protected', 'description', 'verified')
+# created_at of tweets is naive UTC and compared with naive datetime.now() as Evaluate does
+EPOCH = datetime(1970, 1, 1)
+
+
+class BatchResult(NamedTuple):
+    ids: np.ndarray
+    mask: np.ndarray
+    protected: np.ndarray
+    rejections: Dict[str, int]
+
+    def verdicts(self) -> Dict[int, str]:
+        """Verdicts the same as Evaluate.judge_profile and judge_activity give"""
+        labels = np.where(self.mask, VALUABLE, np.where(self.protected, PROTECTED, NOT_VALUABLE))
+        return dict(zip(self.ids.tolist(), labels.tolist()))
+
+
+@dataclass(frozen=True)
+class BatchEvaluate:
+    """Judge a batch of users at once with thresholds applied to numpy columns
+
+    It holds nothing but thresholds, so one instance can be shared by threads.
+    Thresholds are those of Evaluate.
+    """
+    min_followers: int = 10
+    min_friends: int = 10
+    min_favourites: int = 10
+    min_description_length: int = 10
+    active_within: timedelta = timedelta(days=30)
+
+    @staticmethod
+    def build_columns(
+            users: Sequence[Any],
+            timelines: Optional[Mapping[int, Optional[Sequence[Any]]]] = None
+    ) -> Dict[str, np.ndarray]:
+        """Turn users and the latest tweet of their timelines into columns
+
+        Args:
+            users: users of users/lookup(records or tweepy models)
+            timelines: user id to its tweets, None if the timeline was not authorized.
+                Only created_at of the latest tweet is read.
+
+        Returns:
+            Columns keyed by field name. last_tweet_at is seconds since EPOCH
+            and NaN for users without tweets.
+
+        """
+        # One pass over users. Booleans and description lengths become ints too.
+        rows = np.array(
+            [
+                (
+                    user.id,
+                    user.followers_count,
+                    user.friends_count,
+                    user.favourites_count,
+                    user.protected,
+                    len(user.description or ''),
+                    user.verified,
+                )
+                for user in users
+            ],
+            dtype=np.int64
+        ).reshape(len(users), len(USER_FIELDS))
+        columns = {name: rows[:, idx] for idx, name in enumerate(USER_FIELDS)}
+        columns['protected'] = columns['protected'].astype(bool)
+        columns['verified'] = columns['verified'].astype(bool)
+        if timelines is not None:
+            tweets: List[Optional[Sequence[Any]]] = [timelines.get(user.id) for user in users]
+            columns['has_timeline'] = np.array([t is not None for t in tweets], dtype=bool)
+            # Seconds are compared instead of datetime64, which is slow to build from datetime
+            columns['last_tweet_at'] = np.array(
+                [(t[0].created_at - EPOCH).total_seconds() if t else np.nan for t in tweets],
+                dtype=np.float64
+            )
+        return columns
+
+    def evaluate(
+            self,
+            users: Sequence[Any],
+            timelines: Optional[Mapping[int, Optional[Sequence[Any]]]] = None,
+            now: Optional[datetime] = None
+    ) -> BatchResult:
+        """Judge users by their profiles and, when timelines are given, by their activity
+
+        Args:
+            users: users of users/lookup
+            timelines: user id to its tweets. Activity is not judged if None.
+            now: time activity is judged at. datetime.now() if None, as Evaluate does.
+
+        Returns:
+            BatchResult whose mask is True for valuable users in the order of users
+
+        """
+        return self.evaluate_columns(self.build_columns(users, timelines), now)
+
+    def evaluate_columns(self, columns: Dict[str, np.ndarray], now: Optional[datetime] = None) -> BatchResult:
+        """Judge users of columns built by build_columns
+
+        Activity is judged only if columns have last_tweet_at.
+        """
+        passed = {
+            'followers': columns['followers'] >= self.min_followers,
+            'friends': columns['friends'] >= self.min_friends,
+            'favourites': columns['favourites'] >= self.min_favourites,
+            'protected': ~columns['protected'],
+            'description': columns['description'] >= self.min_description_length,
+            'business': ~columns['verified'],
+        }
+        protected = columns['protected']
+        if 'last_tweet_at' in columns:
+            since = ((now or datetime.now()) - self.active_within - EPOCH).total_seconds()
+            # NaN compares False, so users without tweets are inactive
+            passed['inactive'] = columns['last_tweet_at'] > since
+            protected = protected | ~columns['has_timeline']
+
+        mask = np.ones(len(columns['id']), dtype=bool)
+        rejections: Dict[str, int] = {}
+        for rule in RULES:
+            if rule not in passed:
+                continue
+            rejections[rule] = int(np.count_nonzero(mask & ~passed[rule]))
+            mask &= passed[rule]
+        return BatchResult(columns['id'], mask, protected, rejections)
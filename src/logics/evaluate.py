@@ -1,41 +1,105 @@
 from datetime import datetime, timedelta
 from dataclasses import dataclass
-from typing import Union
+from typing import Mapping, Optional, Union
 
 from tweepy.models import User as user_account
 
-from clients import TwitterClient
+from clients import ACTIVITY_PROBE, NoResponseError, TwitterClient
+from models.user_verdicts import (
+    VALUABLE,
+    NOT_VALUABLE,
+    PROTECTED,
+    MISSING,
+)
+from .verdict_cache import VerdictCache
 
 
 @dataclass
 class Evaluate:
     twitter = TwitterClient()
+    # Shared by every Evaluate so that a verdict is reused across logics
+    verdicts = VerdictCache()
     user_info_cache: user_account = None
     tweet_info_cache = None
 
-    def is_valuable_user(self, user_info: Union[int, user_account], tweets=None) -> bool:
+    def is_valuable_user(
+            self,
+            user_info: Union[int, user_account],
+            tweets=None,
+            judged: Optional[Mapping[int, str]] = None
+    ) -> bool:
+        """
+
+        Args:
+            user_info: user id or user account
+            tweets: tweets of the user if they are at hand
+            judged: verdicts looked up beforehand with verdicts.get_many.
+                Users not in it are judged without looking up the cache again.
+
+        Notes:
+            user_info_cache is the account of the user afterwards. It is None if the user is
+            missing, twitter could not be reached, or only an id was given and its verdict
+            was cached, so callers reading it have to handle None.
+            Users that could not be judged as twitter was not reached are not valuable
+            this time, and nothing is cached for them.
+        """
+        user_id: int = user_info if isinstance(user_info, int) else user_info.id
+        verdict: Optional[str] = self.verdicts.get(user_id) if judged is None else judged.get(user_id)
+        if verdict is not None:
+            # Judged recently, so no need to ask twitter again
+            self.user_info_cache = None if isinstance(user_info, int) else user_info
+            return verdict == VALUABLE
+
+        try:
+            verdict = self.judge_user(user_info, tweets)
+        except NoResponseError:
+            self.user_info_cache = None if isinstance(user_info, int) else user_info
+            return False
+        self.verdicts.put(user_id, verdict)
+        return verdict == VALUABLE
+
+    def judge_user(self, user_info: Union[int, user_account], tweets=None) -> str:
+        """Judge a user asking twitter for what is not at hand
+
+        Raises:
+            NoResponseError: twitter could not be reached, so the user cannot be judged
+        """
         if isinstance(user_info, int):
             user_info = self.twitter.fetch_user_info(id=user_info)
         self.user_info_cache = user_info
         if self.user_info_cache is None:
-            return False
+            return MISSING
+
+        # Checked before fetching tweets so that the timeline request is saved for rejected users
+        verdict = self.judge_profile(self.user_info_cache)
+        if verdict != VALUABLE:
+            return verdict
 
         if tweets is None:
-            tweets = self.twitter.fetch_user_tweet(id=self.user_info_cache.id)
+            tweets = self.twitter.fetch_user_timeline(id=self.user_info_cache.id, profile=ACTIVITY_PROBE)
         self.tweet_info_cache = tweets
-        if tweets is None:
-            return False
+        return self.judge_activity(self.tweet_info_cache)
 
-        if not self.is_reliable(self.user_info_cache):
-            return False
+    def judge_profile(self, user: user_account) -> str:
+        if self.is_valuable_profile(user):
+            return VALUABLE
+        return PROTECTED if user.protected else NOT_VALUABLE
+
+    def judge_activity(self, tweets) -> str:
+        if tweets is None:
+            """Not Authorized(protected account)"""
+            return PROTECTED
+        return VALUABLE if self.is_active(tweets) else NOT_VALUABLE
 
-        if not self.has_valuable_description(self.user_info_cache):
+    def is_valuable_profile(self, user: user_account) -> bool:
+        """Checks that only need user info, so that tweets are fetched only for users passing them"""
+        if not self.is_reliable(user):
             return False
 
-        if not self.is_active(self.tweet_info_cache):
+        if not self.has_valuable_description(user):
             return False
 
-        if self.is_business_account(self.user_info_cache):
+        if self.is_business_account(user):
             return False
 
         return True
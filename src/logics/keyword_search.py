@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional
+
+from clients import NoResponseError
+
+
+@dataclass
+class KeywordSearch:
+    """Search of a keyword that skips tweets processed in earlier cycles
+
+    since_id and max_id are the newest and the oldest tweet ids processed.
+    Tweets newer than since_id are searched first from the newest. Once they
+    run out, tweets older than max_id are searched. Both are updated as pages
+    are yielded, so they are right wherever the caller stops. A search without
+    response stops it the same way, so that it is not taken for the end of results.
+    """
+    keyword: str
+    since_id: Optional[int] = None
+    max_id: Optional[int] = None
+    num_searches: int = field(default=0, init=False)
+
+    def iter_pages(self, search: Callable[..., List[Any]], count: int = 100) -> Iterator[List[Any]]:
+        """Yield pages of tweets that have not been processed
+
+        Args:
+            search: function that takes q, count, since_id and max_id and raises NoResponseError
+                when twitter could not be reached. e.g. TwitterClient.fetch_tweets_by_keyword
+            count: tweets per page
+
+        """
+        try:
+            yield from self._iter_pages(search, count)
+        except NoResponseError:
+            # Watermarks stay where the last page yielded left them
+            return
+
+    def _iter_pages(self, search: Callable[..., List[Any]], count: int) -> Iterator[List[Any]]:
+        previous_since_id, previous_max_id = self.since_id, self.max_id
+
+        # Tweets newer than previous_since_id, from the newest
+        upper: Optional[int] = None
+        while True:
+            page = self._search(search, count, since_id=previous_since_id, max_id=upper)
+            if len(page) == 0:
+                break
+            ids = [tweet.id for tweet in page]
+            if upper is None:
+                self.since_id = max(ids)
+            # Until previous_since_id is reached, there is a gap below the tweets processed in this cycle
+            self.max_id = min(ids)
+            upper = min(ids) - 1
+            yield page
+
+        if previous_since_id is None:
+            # Nothing bounded the search above, so it has already gone as far back as possible
+            return
+        # No gap is left, so the range processed is joined with the previous one
+        self.max_id = previous_max_id
+
+        # Tweets older than previous_max_id
+        while True:
+            page = self._search(search, count, max_id=self.max_id - 1)
+            if len(page) == 0:
+                return
+            self.max_id = min(tweet.id for tweet in page)
+            yield page
+
+    def _search(
+            self,
+            search: Callable[..., List[Any]],
+            count: int,
+            since_id: Optional[int] = None,
+            max_id: Optional[int] = None
+    ) -> List[Any]:
+        kwargs = {'q': self.keyword, 'count': count}
+        if since_id is not None:
+            kwargs['since_id'] = since_id
+        if max_id is not None:
+            kwargs['max_id'] = max_id
+        self.num_searches += 1
+        return search(**kwargs) or []
@@ -0,0 +1,69 @@
+import atexit
+from collections import defaultdict
+from dataclasses import dataclass, field
+from threading import Lock
+import time
+from typing import Dict
+
+from models import ValuableUserRepository
+from utils import (
+    LIKE_COUNT_FLUSH_SIZE,
+    LIKE_COUNT_FLUSH_INTERVAL_IN_SECOND,
+)
+
+
+@dataclass
+class LikeCountBuffer:
+    """Accumulate likes per user and write them to db in one statement
+
+    Likes are flushed when flush_size users are pending, when
+    flush_interval_in_sec has passed since the last flush, or at exit.
+    """
+    repository: ValuableUserRepository = field(default_factory=ValuableUserRepository)
+    flush_size: int = LIKE_COUNT_FLUSH_SIZE
+    flush_interval_in_sec: float = LIKE_COUNT_FLUSH_INTERVAL_IN_SECOND
+    _deltas: Dict[int, int] = field(default_factory=lambda: defaultdict(int), init=False, repr=False)
+    _last_flush: float = field(default_factory=time.time, init=False, repr=False)
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        atexit.register(self.flush)
+
+    def add(self, user_id: int, num: int = 1) -> None:
+        """Count num likes for user_id and flush if a trigger is hit
+
+        Args:
+            user_id: user id that has already been registered in db
+            num: number of likes to add
+
+        """
+        with self._lock:
+            self._deltas[user_id] += num
+            is_full = len(self._deltas) >= self.flush_size
+        is_stale = time.time() - self._last_flush >= self.flush_interval_in_sec
+        if is_full or is_stale:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write pending likes to db
+
+        Returns:
+            Number of updated users
+
+        """
+        with self._lock:
+            deltas = dict(self._deltas)
+            self._deltas.clear()
+            self._last_flush = time.time()
+        if len(deltas) == 0:
+            return 0
+
+        try:
+            num_updated = self.repository.database.wait(self.repository.increment_num_likes(deltas))
+        except Exception:
+            # Put them back so that the next flush can retry
+            with self._lock:
+                for user_id, num in deltas.items():
+                    self._deltas[user_id] += num
+            raise
+        return num_updated
@@ -1,36 +1,61 @@
 import asyncio
-from dataclasses import dataclass
-from typing import List, Tuple
-import random
+import math
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 
 from tweepy.models import User as user_account
 from tweepy.error import TweepError
 
-from models import ValuableUsers
+from models import (
+    UserCandidate,
+    fetch_keyword_watermark,
+    save_keyword_watermark,
+)
 from clients import (
     SLACK_INFO,
     SLACK_WARNING,
     SLACK_ERROR,
+    PROFILE_METRICS,
+    LIKE_CANDIDATE,
+    KEYWORD_SEARCH,
+    NoResponseError,
 )
+from utils import POOL_METRICS, session_scope
 from utils.settings import (
     TARGET_KEYWORD_AND_IMPORTANCE,
     DUMPED_FILE,
     DB_LIKES,
-    LIKE_LIMIT_PER_DAY,
+    LIKED_TWEETS_SEED_PAGES,
+    KEYWORD_SEARCH_MAX_PAGES,
+    DB_LIKES_IMPORTANCE,
+    LIKE_YIELD_FLOOR,
 )
 from .base import LogicBase
 from .errors import LogicError
+from .keyword_search import KeywordSearch
+from .like_counter import LikeCountBuffer
+from .like_pacer import EPOCH, LikePacer
+from .like_scheduler import DB_LANE, LikeBudgetScheduler
+from .liked_tweets import LikedTweetIndex
+from .search_planner import SearchPlan, plan_searches
 
 
 @dataclass
 class LikeLogic(LogicBase):
     total_likes: int = 0
+    like_counter: LikeCountBuffer = field(default_factory=LikeCountBuffer)
+    liked_tweets: LikedTweetIndex = field(default_factory=LikedTweetIndex)
+    scheduler: LikeBudgetScheduler = field(default_factory=LikeBudgetScheduler)
+    pacer: LikePacer = field(default_factory=LikePacer)
 
     def fetch_users_with_likes_less_than_threshold_from_db(
             self,
             data_num: int = 50,
             threshold_likes: int = 3
-    ) -> List[ValuableUsers]:
+    ) -> List[UserCandidate]:
         """
 
         Args:
@@ -38,6 +63,7 @@ class LikeLogic(LogicBase):
             threshold_likes:
 
         Returns:
+            Rows of (user_id, screen_name, num_likes) ordered by num_likes
 
         Examples:
             >>> users = LikeBot().fetch_users_with_likes_less_than_threshold_from_db(data_num=10)
@@ -47,26 +73,28 @@ class LikeLogic(LogicBase):
             1237950324255502336
             >>> users[0].screen_name
             '虚実の海の彷徨者'
-            >>> users[0].is_friend
-            False
             >>> users[0].num_likes
             0
+
+        Notes:
+            Thin wrapper of fetch_candidates_from_db for worker threads.
         """
-        session = self.get_session
-        target_users: List[int] = []
-
-        for threshold in range(threshold_likes):
-            users_in_db: List[ValuableUsers] = session.query(ValuableUsers).filter(
-                ValuableUsers.num_likes == threshold).all()
-            target_users.extend(users_in_db[:data_num])
-            if len(target_users[:data_num]) == data_num:
-                session.close()
-                return users_in_db[:data_num]
-
-        SLACK_WARNING.send_message(
-            'There is not enough number of users to like. Update user database immediately.'
+        return self.user_repository.database.wait(
+            self.fetch_candidates_from_db(data_num=data_num, threshold_likes=threshold_likes)
         )
-        session.close()
+
+    async def fetch_candidates_from_db(self, data_num: int = 50, threshold_likes: int = 3) -> List[UserCandidate]:
+        """Return data_num users with likes less than threshold_likes on the asyncpg pool
+
+        Notes:
+            ORDER BY num_likes LIMIT data_num is served by ix_valuable_users_num_likes_id,
+            so only data_num rows are read no matter how large the table is.
+        """
+        target_users = await self.user_repository.fetch_candidates(data_num, threshold_likes)
+        if len(target_users) < data_num:
+            SLACK_WARNING.send_message(
+                'There is not enough number of users to like. Update user database immediately.'
+            )
         return target_users
 
     def increment_num_like_of_user_in_db(self, id_: int) -> None:
@@ -75,100 +103,226 @@ class LikeLogic(LogicBase):
         Args:
             id_: user id that has already been registered in db
 
+        Notes:
+            The increment is buffered by like_counter and written in bulk.
         """
-        session = self.get_session
-        user_model = session.query(ValuableUsers).filter(ValuableUsers.user_id == id_).first()
-        user_model.num_likes += 1
-        session.commit()
+        self.like_counter.add(id_)
 
-    def like_tweet_from_users_in_db(self, data_num: int):
+    def like_tweet_from_users_in_db(
+            self,
+            data_num: int,
+            num_to_like: Optional[int] = None,
+            users: Optional[List[UserCandidate]] = None
+    ):
         """like tweets of users that are saved in db
 
         Args:
             data_num: Number of users to extract for liking
+            num_to_like: Stop once this number of tweets have been liked
+            users: Users fetched by fetch_candidates_from_db beforehand. They are fetched here if None.
 
         """
-        SLACK_INFO.send_message(
-            f'1/3: fetch users from db in like_tweet_from_users_in_db. data_num: {data_num}'
-        )
-        users: List[ValuableUsers] = self.fetch_users_with_likes_less_than_threshold_from_db(
-            data_num=data_num
-        )
+        if users is None:
+            SLACK_INFO.send_message(
+                f'1/3: fetch users from db in like_tweet_from_users_in_db. data_num: {data_num}'
+            )
+            users = self.fetch_users_with_likes_less_than_threshold_from_db(data_num=data_num)
         total_like_tweets: int = 0
+        num_timelines: int = 0
+        likes: List[Tuple[int, Future]] = []
         SLACK_INFO.send_message(
             f'2/3: number of fetched users from db in like_tweet_from_users_in_db: {len(users)}'
         )
         for user in users:
-            tweets = self.twitter.fetch_user_tweet(id=user.user_id)
+            if num_to_like is not None and len(likes) >= num_to_like:
+                break
+            tweets = self.twitter.fetch_user_tweet(id=user.user_id, profile=LIKE_CANDIDATE)
+            num_timelines += 1
+            if tweets is not None:
+                unliked_ids = set(self.liked_tweets.filter_unliked([tweet.id for tweet in tweets]))
+                tweets = [tweet for tweet in tweets if tweet.id in unliked_ids]
             likable_tweet = self.evaluate.find_likable_tweet(tweets)
             if likable_tweet is None:
                 continue
-            self.twitter.like_tweet(id=likable_tweet.id)
-            self.increment_num_like_of_user_in_db(id_=user.user_id)
+            likes.append((user.user_id, self.pacer.submit(self.like, likable_tweet.id)))
+        for user_id, like in likes:
+            if not self.is_liked(like):
+                continue
+            self.increment_num_like_of_user_in_db(id_=user_id)
             self.total_likes += 1
             total_like_tweets += 1
+        self.like_counter.flush()
+        self.scheduler.record(DB_LANE, total_like_tweets, num_timelines)
         SLACK_INFO.send_message(f'{total_like_tweets} tweets have been liked.')
 
-    def like_from_keyword(self, search_word: str, num_to_like: int):
-        """like tweets searched by a keyword and save their owner's data
+    def like(self, tweet_id: int):
+        """like a tweet and save it as liked
 
         Args:
-            search_word: keyword to search tweets
-            num_to_like: number of likes to execute
+            tweet_id: id of tweet to like
+
+        Returns:
+            status liked or None if twitter refused it as already liked or deleted
 
+        Raises:
+            NoResponseError: twitter could not be reached, so pacer does not count it
+
+        Notes:
+            This runs as a job of pacer. Tweets that failed as already liked or deleted
+            are saved as well so that they are not tried again. Tweets whose request got
+            no response are not, since they may not have been liked.
         """
-        SLACK_INFO.send_message(f'1/5: Fetch tweets by search_word「{search_word}」num_to_like: {num_to_like}')
-        tweets = self.twitter.fetch_tweets_by_keyword(q=search_word, count=100)
+        status = self.twitter.like_tweet(id=tweet_id)
+        self.liked_tweets.add_many([tweet_id])
+        return status
 
-        all_user_ids: List[int] = [
-            tweet.author.id
-            for tweet in tweets
-        ]
-        # TODO: FIx this later
-        duplicate_user_ids = [
-            user_id
-            for user_id in set(all_user_ids)
-            if all_user_ids.count(user_id) > 1
-        ]
+    @staticmethod
+    def is_liked(like: Future) -> bool:
+        """Whether a like submitted to pacer has been done. Blocks until it runs."""
+        try:
+            return like.result() is not None
+        except NoResponseError:
+            return False
+
+    def filter_tweets_to_like(self, tweets) -> List:
+        """Filter tweets by their owner's value, likability and whether they have been liked
+
+        Args:
+            tweets: tweets searched by a keyword
+
+        """
+        # Users who tweeted more than once in the results are skipped
+        num_tweets_by_user = Counter(tweet.author.id for tweet in tweets)
+        authors = [user_id for user_id, num in num_tweets_by_user.items() if num == 1]
+        # Verdicts of all authors in one lookup instead of one per tweet
+        judged: Dict[int, str] = self.evaluate.verdicts.get_many(authors)
 
-        SLACK_INFO.send_message(f"2/5: filter {len(tweets)}tweets based on user's value")
         filtered_tweets_by_user_info = [
             tweet
             for tweet in tweets
-            if self.evaluate.is_valuable_user(tweet.author, [tweet])
-            if tweet.author.id not in duplicate_user_ids
+            if num_tweets_by_user[tweet.author.id] == 1
+            if self.evaluate.is_valuable_user(tweet.author, [tweet], judged)
         ]
 
-        SLACK_INFO.send_message(
-            f"3/5: filter {len(filtered_tweets_by_user_info)}tweets based on tweet's likability"
-        )
-        filtered_tweets_by_likability = [
+        # Search always says favorited=False, so tweets liked before are dropped here
+        unliked_ids = set(self.liked_tweets.filter_unliked([tweet.id for tweet in filtered_tweets_by_user_info]))
+        return [
             tweet
             for tweet in filtered_tweets_by_user_info
+            if tweet.id in unliked_ids
             if self.evaluate.is_likable(tweet)
         ]
 
-        target_tweets_to_like = filtered_tweets_by_likability[:num_to_like]
-        if len(target_tweets_to_like) < num_to_like:
-            SLACK_WARNING.send_message(
-                f'Could not find {num_to_like} tweets to like.'
-                f'I only found {len(target_tweets_to_like)}...Sorry bro.'
+    def like_from_keyword(self, search_word: str, num_to_like: int):
+        """like tweets searched by a keyword and save their owner's data
+
+        Args:
+            search_word: keyword to search tweets
+            num_to_like: number of likes to execute
+
+        """
+        self.like_from_search(SearchPlan(OrderedDict([(search_word, num_to_like)])))
+
+    def like_from_search(self, plan: SearchPlan) -> Dict[str, int]:
+        """like tweets searched by an OR query of keywords and save their owner's data
+
+        Args:
+            plan: keywords and number of likes for each of them
+
+        Returns:
+            Number of likes of each keyword
+
+        Notes:
+            Only tweets newer or older than the ones processed in earlier cycles are searched,
+            and more pages are searched while there are not enough tweets to like.
+            Tweets are routed back to keywords by their text and hashtags. Tweets matched by
+            none of them are not liked, so that each keyword's yield only counts its own likes.
+        """
+        SLACK_INFO.send_message(f'1/5: Fetch tweets by query「{plan.query}」num_to_like: {plan.num_to_like}')
+        keyword_search: KeywordSearch = self.load_keyword_search(plan)
+        num_tweets: int = 0
+        candidates: Dict[Optional[str], List] = defaultdict(list)
+        search = partial(self.twitter.fetch_tweets_by_keyword, profile=KEYWORD_SEARCH)
+        pages = keyword_search.iter_pages(search, count=100)
+        for page_no, tweets in enumerate(pages, start=1):
+            num_tweets += len(tweets)
+            SLACK_INFO.send_message(f"2/5: filter {len(tweets)}tweets based on user's value and likability")
+            for keyword, routed_tweets in plan.route(self.filter_tweets_to_like(tweets)).items():
+                candidates[keyword].extend(routed_tweets)
+            shortage = sum(
+                max(budget - len(candidates[keyword]), 0) for keyword, budget in plan.budgets.items()
             )
+            if shortage == 0 or page_no >= KEYWORD_SEARCH_MAX_PAGES:
+                break
+        self.save_keyword_search(plan, keyword_search)
+        SLACK_INFO.send_message(
+            f"3/5: {sum(len(tweets) for tweets in candidates.values())}/{num_tweets}tweets are likable. "
+            f"{len(candidates[None])} of them matched no keyword and are skipped."
+        )
 
-        SLACK_INFO.send_message(f"4/5: Like them all {len(target_tweets_to_like)}")
+        target_tweets_by_keyword: Dict[str, List] = {}
+        for keyword, budget in plan.budgets.items():
+            target_tweets = candidates[keyword][:budget]
+            target_tweets_by_keyword[keyword] = target_tweets
+            if len(target_tweets) < budget:
+                SLACK_WARNING.send_message(
+                    f'Could not find {budget} tweets to like for「{keyword}」.'
+                    f'I only found {len(target_tweets)}...Sorry bro.'
+                )
+
+        num_target_tweets = sum(len(tweets) for tweets in target_tweets_by_keyword.values())
+        SLACK_INFO.send_message(f"4/5: Like them all {num_target_tweets}")
+        likes: Dict[str, List[Tuple[user_account, Future]]] = {
+            keyword: [(tweet.author, self.pacer.submit(self.like, tweet.id)) for tweet in target_tweets]
+            for keyword, target_tweets in target_tweets_by_keyword.items()
+        }
         users_to_save: List[user_account] = []
-        for tweet in target_tweets_to_like:
-            status = self.twitter.like_tweet(id=tweet.id)
-            if status is not None:
-                users_to_save.append(tweet.author)
+        num_liked_by_keyword: Dict[str, int] = {}
+        for keyword, likes_of_keyword in likes.items():
+            num_liked_by_keyword[keyword] = 0
+            for author, like in likes_of_keyword:
+                if self.is_liked(like):
+                    users_to_save.append(author)
+                    num_liked_by_keyword[keyword] += 1
 
         SLACK_INFO.send_message(f"5/5: Save {len(users_to_save)} users")
-        self.save_new_users(users_to_save, num_likes=1)
+        num_saved = self.save_new_users(users_to_save, num_likes=1)
+        SLACK_INFO.send_message(f'{num_saved} of them are new to db.')
 
         self.total_likes += len(users_to_save)
+        self.scheduler.record_search(plan.budgets, num_liked_by_keyword, keyword_search.num_searches)
         SLACK_INFO.send_message(
-            f'{len(users_to_save)}/{len(tweets)}tweets searched by keyword have been liked.'
+            f'{len(users_to_save)}/{num_tweets}tweets searched by keyword have been liked.'
         )
+        return num_liked_by_keyword
+
+    def load_keyword_search(self, plan: SearchPlan) -> KeywordSearch:
+        """Search of plan.query resuming from watermarks of its keywords
+
+        Notes:
+            Watermarks are kept per keyword since a query changes with budgets.
+            The query resumes from the range processed for all of its keywords, i.e. the
+            newest since_id and max_id of the others are searched again rather than skipped.
+        """
+        with session_scope() as session:
+            watermarks = [fetch_keyword_watermark(session, keyword) for keyword in plan.keywords]
+        since_ids = [since_id for since_id, _ in watermarks]
+        max_ids = [max_id for _, max_id in watermarks]
+        if None in since_ids or None in max_ids or max(max_ids) > min(since_ids):
+            # Some keyword has never been searched or the ranges do not overlap
+            return KeywordSearch(plan.query)
+        return KeywordSearch(plan.query, min(since_ids), max(max_ids))
+
+    def save_keyword_search(self, plan: SearchPlan, keyword_search: KeywordSearch) -> None:
+        """Save the range processed by the query as watermarks of each of its keywords"""
+        with session_scope() as session:
+            for keyword in plan.keywords:
+                save_keyword_watermark(
+                    session,
+                    keyword,
+                    keyword_search.since_id,
+                    keyword_search.max_id
+                )
 
     @classmethod
     async def main(cls):
@@ -176,49 +330,88 @@ class LikeLogic(LogicBase):
 
         """
         cls_instance = cls()
+        if LIKED_TWEETS_SEED_PAGES > 0:
+            favorite_ids: List[int] = await cls_instance.run_in_thread(
+                cls_instance.twitter.fetch_favorite_tweet_ids,
+                LIKED_TWEETS_SEED_PAGES
+            )
+            # When they were liked is unknown, so they are kept out of the ledger of the last 24 hours
+            await cls_instance.run_in_thread(cls_instance.liked_tweets.add_many, favorite_ids, EPOCH)
+        num_liked: int = await cls_instance.run_in_thread(cls_instance.liked_tweets.load)
+        SLACK_INFO.send_message(f'{num_liked} liked tweets have been loaded.')
+        num_liked_today: int = await cls_instance.run_in_thread(cls_instance.pacer.load)
+        cls_instance.scheduler.restore(cls_instance.pacer.like_times)
+        SLACK_INFO.send_message(f'{num_liked_today} tweets have been liked in the last 24 hours.')
         while True:
-            try:
-                cls_instance.like_tweet_from_users_in_db(data_num=DB_LIKES)
-            except TweepError as e:
-                SLACK_ERROR.send_message(
-                    'An error occurred from tweepy client of like_tweet_from_users_in_db.'
-                    f'Reason for this error is「{e.reason}」'
-                )
-                raise e
-            except LogicError as e:
-                SLACK_ERROR.send_message(
-                    'An error occurred from tweepy client of like_tweet_from_users_in_db.'
-                    f'Reason for this error is「{e}」'
-                )
-                raise e
-            except Exception as e:
-                # TODO: Narrow Exception by creating wrapper
-                import sys
-                tb = sys.exc_info()[2]
-                SLACK_ERROR.send_message(
-                    'An error occurred  like_tweet_from_users_in_db.'
+            allocation: Dict[str, int] = cls_instance.scheduler.allocate(
+                OrderedDict([(DB_LANE, DB_LIKES_IMPORTANCE)] + TARGET_KEYWORD_AND_IMPORTANCE)
+            )
+            SLACK_INFO.send_message(f'db pool: {POOL_METRICS}')
+            SLACK_INFO.send_message(f'request profiles: {PROFILE_METRICS}')
+            if sum(allocation.values()) == 0:
+                seconds = max(cls_instance.scheduler.seconds_until_available(), 60)
+                SLACK_INFO.send_message(f'Likes of today are used up. Wait for {int(seconds)} seconds.')
+                await asyncio.sleep(seconds)
+                continue
+
+            db_likes = allocation.pop(DB_LANE)
+            if db_likes > 0:
+                data_num = min(
+                    DB_LIKES,
+                    math.ceil(db_likes / max(cls_instance.scheduler.yield_of(DB_LANE), LIKE_YIELD_FLOOR))
                 )
-                SLACK_ERROR.send_message(e.with_traceback(tb))
-                raise e
-            total_likes_by_keyword = int(LIKE_LIMIT_PER_DAY - cls_instance.total_likes)
-            random_keywords_and_importance: List[Tuple[str, int]] = random.sample(
-                TARGET_KEYWORD_AND_IMPORTANCE,
-                len(TARGET_KEYWORD_AND_IMPORTANCE)
+                try:
+                    SLACK_INFO.send_message(f'1/3: fetch users from db. data_num: {data_num}')
+                    users: List[UserCandidate] = await cls_instance.fetch_candidates_from_db(data_num=data_num)
+                    await cls_instance.run_in_thread(
+                        cls_instance.like_tweet_from_users_in_db,
+                        data_num=data_num,
+                        num_to_like=db_likes,
+                        users=users
+                    )
+                except TweepError as e:
+                    SLACK_ERROR.send_message(
+                        'An error occurred from tweepy client of like_tweet_from_users_in_db.'
+                        f'Reason for this error is「{e.reason}」'
+                    )
+                    raise e
+                except LogicError as e:
+                    SLACK_ERROR.send_message(
+                        'An error occurred from tweepy client of like_tweet_from_users_in_db.'
+                        f'Reason for this error is「{e}」'
+                    )
+                    raise e
+                except Exception as e:
+                    # TODO: Narrow Exception by creating wrapper
+                    import sys
+                    tb = sys.exc_info()[2]
+                    SLACK_ERROR.send_message(
+                        'An error occurred  like_tweet_from_users_in_db.'
+                    )
+                    SLACK_ERROR.send_message(e.with_traceback(tb))
+                    raise e
+
+            budgets: Dict[str, int] = allocation
+            plans: List[SearchPlan] = plan_searches(
+                budgets,
+                [keyword for keyword, _ in TARGET_KEYWORD_AND_IMPORTANCE]
+            )
+            SLACK_INFO.send_message(
+                f'{sum(len(plan.keywords) for plan in plans)} keywords are searched by {len(plans)} queries.'
             )
-            for keyword, importance in random_keywords_and_importance:
+            for plan in plans:
                 await asyncio.sleep(1)
-                like_num = int(total_likes_by_keyword * importance / len(TARGET_KEYWORD_AND_IMPORTANCE))
                 try:
-                    cls_instance.like_from_keyword(keyword, like_num)
+                    await cls_instance.run_in_thread(cls_instance.like_from_search, plan)
                 except TweepError as e:
                     SLACK_ERROR.send_message(
-                        'An error occurred from tweepy client of like_from_keyword.'
+                        'An error occurred from tweepy client of like_from_search.'
                         f'Reason for this error is「{e.reason}」'
                     )
                     raise e
                 except LogicError as e:
                     SLACK_ERROR.send_message(
-                        'A LogicError occurred from like_from_keyword.'
+                        'A LogicError occurred from like_from_search.'
                         f'Reason for this error is「{e}」'
                     )
                     raise e
@@ -227,7 +420,7 @@ class LikeLogic(LogicBase):
                     import sys
                     tb = sys.exc_info()[2]
                     SLACK_ERROR.send_message(
-                        'An error occurred from tweepy client of like_from_keyword.'
+                        'An error occurred from tweepy client of like_from_search.'
                     )
                     SLACK_ERROR.send_message(e.with_traceback(tb))
                     raise e
@@ -0,0 +1,162 @@
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import heapq
+import itertools
+from threading import Condition, Thread
+import time
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from clients import SLACK_WARNING, LikeLimitExceeded
+from models import fetch_liked_times_since
+from utils import (
+    SESSION_FACTORY,
+    session_scope,
+    LIKE_LIMIT_PER_DAY,
+    LIKE_BUDGET_WINDOW_IN_SECOND,
+    LIKE_PACE_BURST,
+    LIKE_LOCKOUT_IN_SECOND,
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+# (due, sequence, func, args, kwargs, future)
+Job = Tuple[float, int, Callable[..., Any], tuple, dict, Future]
+
+
+@dataclass
+class LikePacer:
+    """Run likes as timed jobs spread evenly over the day
+
+    Each job is given a slot interval apart, where interval is window_in_sec / daily_limit.
+    After being idle, up to burst slots can be caught up. No slot is given while
+    daily_limit likes are in the rolling window, counting both the ledger and jobs waiting.
+    The ledger is loaded from liked_tweets, so it survives restarts. Only jobs that return
+    are counted in it. A job raises when twitter did not answer, e.g. NoResponseError.
+
+    When a job raises LikeLimitExceeded, only the jobs are suspended until the lockout
+    ends. Other endpoints are not touched, since jobs run in a thread of their own.
+    """
+    daily_limit: int = LIKE_LIMIT_PER_DAY
+    window_in_sec: float = LIKE_BUDGET_WINDOW_IN_SECOND
+    burst: int = LIKE_PACE_BURST
+    lockout_in_sec: float = LIKE_LOCKOUT_IN_SECOND
+    session_factory: Callable[[], Session] = SESSION_FACTORY
+    _ledger: Deque[float] = field(default_factory=deque, init=False, repr=False)
+    _jobs: List[Job] = field(default_factory=list, init=False, repr=False)
+    _sequence: Any = field(default_factory=itertools.count, init=False, repr=False)
+    _next_slot: float = field(default=0., init=False, repr=False)
+    _suspended_until: float = field(default=0., init=False, repr=False)
+    _condition: Condition = field(default_factory=Condition, init=False, repr=False)
+
+    def __post_init__(self):
+        Thread(target=self._work, daemon=True).start()
+
+    @property
+    def interval(self) -> float:
+        return self.window_in_sec / self.daily_limit
+
+    @property
+    def like_times(self) -> List[float]:
+        """Epoch times of likes in the rolling window"""
+        with self._condition:
+            self._expire(time.time())
+            return list(self._ledger)
+
+    @property
+    def suspended_until(self) -> Optional[float]:
+        with self._condition:
+            return self._suspended_until if self._suspended_until > time.time() else None
+
+    def load(self) -> int:
+        """Load likes of the rolling window from liked_tweets
+
+        Returns:
+            Number of likes in the window
+
+        """
+        since = datetime.utcnow() - timedelta(seconds=self.window_in_sec)
+        with session_scope(factory=self.session_factory) as session:
+            liked_times = fetch_liked_times_since(session, since)
+        with self._condition:
+            self._ledger = deque((liked_at - EPOCH).total_seconds() for liked_at in liked_times)
+            return len(self._ledger)
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedule a like at the next free slot
+
+        Args:
+            func: function that sends one like
+            *args: args of func
+            **kwargs: kwargs of func
+
+        Returns:
+            Future of the return of func
+
+        """
+        future: Future = Future()
+        with self._condition:
+            due = self._reserve_slot(time.time())
+            heapq.heappush(self._jobs, (due, next(self._sequence), func, args, kwargs, future))
+            self._condition.notify()
+        return future
+
+    def suspend(self, until: float) -> None:
+        """Push every job waiting to slots after until"""
+        with self._condition:
+            self._suspended_until = max(self._suspended_until, until)
+            jobs = sorted(self._jobs)
+            self._jobs = []
+            self._next_slot = 0.
+            now = time.time()
+            for _, sequence, func, args, kwargs, future in jobs:
+                heapq.heappush(self._jobs, (self._reserve_slot(now), sequence, func, args, kwargs, future))
+            self._condition.notify()
+        SLACK_WARNING.send_message(
+            f'Likes are suspended until {datetime.fromtimestamp(until):%Y-%m-%d %H:%M:%S}. '
+            f'{len(jobs)} likes are waiting. Other requests keep going.'
+        )
+
+    def _reserve_slot(self, now: float) -> float:
+        self._expire(now)
+        slot = max(self._next_slot, now - self.burst * self.interval, self._suspended_until)
+        times = list(self._ledger) + sorted(job[0] for job in self._jobs)
+        if len(times) >= self.daily_limit:
+            slot = max(slot, times[-self.daily_limit] + self.window_in_sec)
+        self._next_slot = slot + self.interval
+        # Slots caught up by burst may be in the past. Jobs are due when they can really run,
+        # so that the rolling window above counts them at that time.
+        return max(slot, now)
+
+    def _expire(self, now: float) -> None:
+        while len(self._ledger) != 0 and self._ledger[0] <= now - self.window_in_sec:
+            self._ledger.popleft()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while len(self._jobs) == 0 or self._jobs[0][0] > time.time():
+                    timeout = self._jobs[0][0] - time.time() if len(self._jobs) != 0 else None
+                    self._condition.wait(timeout)
+                due, sequence, func, args, kwargs, future = heapq.heappop(self._jobs)
+            # Jobs put back after a lockout are already running
+            if not future.running() and not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = func(*args, **kwargs)
+            except LikeLimitExceeded as e:
+                with self._condition:
+                    heapq.heappush(self._jobs, (due, sequence, func, args, kwargs, future))
+                self.suspend(e.reset_at or time.time() + self.lockout_in_sec)
+                continue
+            except Exception as e:
+                # e.g. NoResponseError. Twitter has not answered, so no like is counted.
+                future.set_exception(e)
+            else:
+                with self._condition:
+                    self._ledger.append(time.time())
+                future.set_result(result)
@@ -0,0 +1,132 @@
+from collections import deque
+from dataclasses import dataclass, field
+import math
+from threading import Lock
+import time
+from typing import Deque, Dict, List, Tuple
+
+from clients import SLACK_INFO
+from utils.settings import (
+    LIKE_LIMIT_PER_DAY,
+    DB_LIKES,
+    KEYWORD_SEARCH_MAX_PAGES,
+    LIKE_BUDGET_WINDOW_IN_SECOND,
+    LIKE_YIELD_PRIOR,
+    LIKE_YIELD_FLOOR,
+    LIKE_YIELD_SMOOTHING,
+)
+
+DB_LANE = 'db'
+
+
+@dataclass
+class LikeBudgetScheduler:
+    """Allocate the daily likes to lanes where they cost the fewest API calls
+
+    A lane is a keyword or DB_LANE. Yield of a lane is an exponential moving
+    average of likes per API call(searches or timelines). Likes are counted in a
+    rolling window, so the budget comes back as likes get older than window_in_sec.
+    """
+    daily_limit: int = LIKE_LIMIT_PER_DAY
+    window_in_sec: float = LIKE_BUDGET_WINDOW_IN_SECOND
+    smoothing: float = LIKE_YIELD_SMOOTHING
+    yields: Dict[str, float] = field(default_factory=dict)
+    _likes: Deque[Tuple[float, int]] = field(default_factory=deque, init=False, repr=False)
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    def yield_of(self, lane: str) -> float:
+        return self.yields.get(lane, LIKE_YIELD_PRIOR)
+
+    def record(self, lane: str, likes: int, calls: float) -> None:
+        """Count likes of a lane and update its yield
+
+        Args:
+            lane: keyword or DB_LANE
+            likes: number of likes done
+            calls: number of API calls spent to find them
+
+        """
+        now = time.time()
+        with self._lock:
+            if likes > 0:
+                self._likes.append((now, likes))
+            if calls > 0:
+                observed = likes / calls
+                self.yields[lane] = (1 - self.smoothing) * self.yield_of(lane) + self.smoothing * observed
+
+    def restore(self, like_times: List[float]) -> None:
+        """Count likes done before a restart
+
+        Args:
+            like_times: epoch times of likes in ascending order
+
+        """
+        with self._lock:
+            self._likes.extend((liked_at, 1) for liked_at in like_times)
+
+    def record_search(self, budgets: Dict[str, int], likes: Dict[str, int], calls: int) -> None:
+        """Record keywords searched by one query, sharing calls by their budgets"""
+        total_budget = sum(budgets.values())
+        for keyword, budget in budgets.items():
+            self.record(keyword, likes.get(keyword, 0), calls * budget / total_budget if total_budget else 0)
+
+    @property
+    def remaining(self) -> int:
+        """Likes left in the current window"""
+        with self._lock:
+            self._expire(time.time())
+            return max(self.daily_limit - sum(num for _, num in self._likes), 0)
+
+    def seconds_until_available(self) -> float:
+        """Seconds until the oldest like leaves the window"""
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            if len(self._likes) == 0:
+                return 0.
+            return max(self._likes[0][0] + self.window_in_sec - now, 0.)
+
+    def capacity_of(self, lane: str) -> int:
+        """Likes a lane can give in a cycle"""
+        max_calls = DB_LIKES if lane == DB_LANE else KEYWORD_SEARCH_MAX_PAGES
+        return max(math.ceil(max(self.yield_of(lane), LIKE_YIELD_FLOOR) * max_calls), 1)
+
+    def allocate(self, importance: Dict[str, float]) -> Dict[str, int]:
+        """Split the remaining likes among lanes
+
+        Args:
+            importance: lane to its weight. Order is kept in the result.
+
+        Returns:
+            lane to number of likes. Lanes without likes get 0.
+
+        Notes:
+            Likes are given one by one to the lane with the highest
+            importance * yield / (likes given + 1), skipping lanes at capacity.
+            Whatever is left over stays for the next cycle.
+        """
+        budget = self.remaining
+        scores = {
+            lane: weight * max(self.yield_of(lane), LIKE_YIELD_FLOOR)
+            for lane, weight in importance.items()
+        }
+        allocation = {lane: 0 for lane in importance}
+        open_lanes = {lane for lane, score in scores.items() if score > 0}
+        for _ in range(budget):
+            open_lanes = {lane for lane in open_lanes if allocation[lane] < self.capacity_of(lane)}
+            if len(open_lanes) == 0:
+                break
+            lane = max(open_lanes, key=lambda lane_: scores[lane_] / (allocation[lane_] + 1))
+            allocation[lane] += 1
+
+        SLACK_INFO.send_message(
+            f'{sum(allocation.values())}/{budget} likes left today are allocated: ' + ', '.join(
+                f'{lane}={num}(yield {self.yield_of(lane):.2f})'
+                for lane, num in allocation.items() if num > 0
+            )
+        )
+        return allocation
+
+    def _expire(self, now: float) -> None:
+        while len(self._likes) != 0 and self._likes[0][0] <= now - self.window_in_sec:
+            self._likes.popleft()
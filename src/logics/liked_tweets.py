@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock
+from typing import Callable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from models import (
+    fetch_liked_tweet_ids,
+    iter_all_liked_tweet_ids,
+    save_liked_tweets,
+)
+from utils import SESSION_FACTORY, LIKED_TWEETS_BLOOM_CAPACITY, session_scope
+from utils.bloom_filter import BloomFilter
+
+
+@dataclass
+class LikedTweetIndex:
+    """Tweets that have been liked, so that no like is spent on them again
+
+    liked_tweets is the source of truth. A bloom filter loaded from it answers
+    most lookups in memory and only possible hits are confirmed in db.
+    """
+    session_factory: Callable[[], Session] = SESSION_FACTORY
+    capacity: int = LIKED_TWEETS_BLOOM_CAPACITY
+    _bloom: Optional[BloomFilter] = field(default=None, init=False, repr=False)
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    def load(self) -> int:
+        """Build the bloom filter from liked_tweets
+
+        Returns:
+            Number of liked tweets loaded
+
+        """
+        bloom = BloomFilter(self.capacity)
+        num_loaded = 0
+        with session_scope(factory=self.session_factory) as session:
+            for tweet_id in iter_all_liked_tweet_ids(session):
+                bloom.add(tweet_id)
+                num_loaded += 1
+        with self._lock:
+            self._bloom = bloom
+        return num_loaded
+
+    def filter_unliked(self, tweet_ids: List[int]) -> List[int]:
+        """Return tweet_ids that have not been liked keeping their order
+
+        Args:
+            tweet_ids: tweet ids to check
+
+        """
+        if self._bloom is None:
+            self.load()
+        maybe_liked: List[int] = [
+            tweet_id for tweet_id in tweet_ids
+            if tweet_id in self._bloom
+        ]
+        if len(maybe_liked) == 0:
+            return list(tweet_ids)
+
+        with session_scope(factory=self.session_factory) as session:
+            liked = fetch_liked_tweet_ids(session, maybe_liked)
+        return [
+            tweet_id for tweet_id in tweet_ids
+            if tweet_id not in liked
+        ]
+
+    def add_many(self, tweet_ids: List[int], liked_at: Optional[datetime] = None) -> None:
+        """Save tweet_ids as liked
+
+        Args:
+            tweet_ids: tweet ids that have been liked
+            liked_at: when they were liked. Now by default.
+
+        """
+        if len(tweet_ids) == 0:
+            return
+        with session_scope(factory=self.session_factory) as session:
+            save_liked_tweets(session, tweet_ids, liked_at or datetime.utcnow())
+        if self._bloom is None:
+            return
+        with self._lock:
+            for tweet_id in tweet_ids:
+                self._bloom.add(tweet_id)
@@ -0,0 +1,86 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterator, List
+
+# Put after the last item of a queue
+_END = object()
+
+
+@dataclass
+class Stage:
+    """Step of a pipeline
+
+    func is a blocking function that takes an item from the previous stage and
+    returns items for the next one. concurrency items are processed at a time.
+    func is awaited on the event loop instead of a thread if is_async.
+    """
+    name: str
+    func: Callable[[Any], Any]
+    concurrency: int = 1
+    is_async: bool = False
+
+
+async def run_pipeline(
+        source: Iterator[Any],
+        stages: List[Stage],
+        run_in_thread: Callable[..., Awaitable[Any]],
+        queue_size: int
+) -> None:
+    """Run stages concurrently connected by bounded queues
+
+    Args:
+        source: blocking iterator of items for the first stage
+        stages: stages to pass items through in order
+        run_in_thread: coroutine function to run blocking functions with
+        queue_size: max number of items waiting between two stages
+
+    Notes:
+        A stage that waits for its rate limit stops taking items, its queue fills up
+        and earlier stages are held back, so nothing piles up in memory.
+        The first error cancels every stage and is raised.
+    """
+    queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+
+    async def produce():
+        while True:
+            item = await run_in_thread(next, source, _END)
+            if item is _END:
+                break
+            await queues[0].put(item)
+        for _ in range(stages[0].concurrency):
+            await queues[0].put(_END)
+
+    num_running = [stage.concurrency for stage in stages]
+
+    async def work(idx: int):
+        stage = stages[idx]
+        is_last = idx == len(stages) - 1
+        while True:
+            item = await queues[idx].get()
+            if item is _END:
+                break
+            if stage.is_async:
+                outputs = await stage.func(item)
+            else:
+                outputs = await run_in_thread(stage.func, item)
+            if is_last:
+                continue
+            for output in outputs:
+                await queues[idx + 1].put(output)
+        num_running[idx] -= 1
+        if num_running[idx] == 0 and not is_last:
+            for _ in range(stages[idx + 1].concurrency):
+                await queues[idx + 1].put(_END)
+
+    tasks = [asyncio.ensure_future(produce())] + [
+        asyncio.ensure_future(work(idx))
+        for idx, stage in enumerate(stages)
+        for _ in range(stage.concurrency)
+    ]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if task.exception() is not None:
+            raise task.exception()
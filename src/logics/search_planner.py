@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import re
+from typing import Any, Dict, List, Optional, Pattern, Sequence
+
+from utils.settings import (
+    SEARCH_QUERY_MAX_LENGTH,
+    SEARCH_KEYWORDS_PER_QUERY,
+)
+
+
+def _quote(keyword: str) -> str:
+    return f'"{keyword}"' if ' ' in keyword else keyword
+
+
+def _pattern_of(keyword: str) -> Pattern:
+    # Latin keywords match whole words only e.g. 'AI' does not match 'said'.
+    # Japanese has no spaces between words, so it matches anywhere in Japanese text.
+    return re.compile(rf'(?<![0-9a-z_]){re.escape(keyword.casefold())}(?![0-9a-z_])')
+
+
+def _words_of(tweet: Any) -> str:
+    text: str = getattr(tweet, 'full_text', None) or getattr(tweet, 'text', '') or ''
+    hashtags = getattr(tweet, 'hashtags', None)
+    if hashtags is None:
+        # tweepy models
+        hashtags = [hashtag['text'] for hashtag in (getattr(tweet, 'entities', None) or {}).get('hashtags', [])]
+    return ' '.join([text] + [f'#{hashtag}' for hashtag in hashtags]).casefold()
+
+
+@dataclass
+class SearchPlan:
+    """Keywords searched together by one OR query
+
+    budgets is the number of likes for each keyword in the order they are matched.
+    """
+    budgets: 'OrderedDict[str, int]'
+
+    @property
+    def keywords(self) -> List[str]:
+        return list(self.budgets.keys())
+
+    @property
+    def query(self) -> str:
+        return ' OR '.join(_quote(keyword) for keyword in self.keywords)
+
+    @property
+    def num_to_like(self) -> int:
+        return sum(self.budgets.values())
+
+    def route(self, tweets: List[Any]) -> Dict[Optional[str], List[Any]]:
+        """Assign each tweet to the first keyword found as a word in its text or hashtags
+
+        Args:
+            tweets: tweets returned for query
+
+        Returns:
+            keyword to tweets. Tweets matched by something else e.g. screen name are under None.
+
+        """
+        routed: Dict[Optional[str], List[Any]] = {keyword: [] for keyword in self.keywords}
+        routed[None] = []
+        patterns = [(keyword, _pattern_of(keyword)) for keyword in self.keywords]
+        for tweet in tweets:
+            words = _words_of(tweet)
+            keyword = next((keyword for keyword, pattern in patterns if pattern.search(words)), None)
+            routed[keyword].append(tweet)
+        return routed
+
+
+def plan_searches(budgets: Dict[str, int], keywords: Sequence[str]) -> List[SearchPlan]:
+    """Group keywords with budget into as few OR queries as possible
+
+    Args:
+        budgets: keyword to number of likes
+        keywords: all keywords in a fixed order e.g. that of TARGET_KEYWORD_AND_IMPORTANCE
+
+    Returns:
+        Plans in the order of keywords
+
+    Notes:
+        Keywords without budget are not searched. Keywords are grouped in the order of keywords
+        while the query fits in SEARCH_QUERY_MAX_LENGTH and has at most SEARCH_KEYWORDS_PER_QUERY
+        keywords. Queries change with budgets, so watermarks are kept per keyword instead.
+    """
+    plans: List[SearchPlan] = []
+    current: 'OrderedDict[str, int]' = OrderedDict()
+    for keyword in keywords:
+        budget = budgets.get(keyword, 0)
+        if budget <= 0:
+            continue
+        candidate = SearchPlan(OrderedDict(current, **{keyword: budget}))
+        fits = len(candidate.keywords) <= SEARCH_KEYWORDS_PER_QUERY \
+            and len(candidate.query) <= SEARCH_QUERY_MAX_LENGTH
+        if len(current) == 0 or fits:
+            current = candidate.budgets
+            continue
+        plans.append(SearchPlan(current))
+        current = OrderedDict([(keyword, budget)])
+    if len(current) != 0:
+        plans.append(SearchPlan(current))
+    return plans
@@ -1,8 +1,11 @@
-import asyncio
 import os
-from dataclasses import dataclass
-from typing import Set, List
+from dataclasses import dataclass, field
+from functools import partial
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
+import numpy as np
+from sqlalchemy.orm import Session
 from tweepy.models import User as user_account
 from tweepy.error import TweepError
 
@@ -10,58 +13,222 @@ from clients import (
     SLACK_INFO,
     SLACK_WARNING,
     SLACK_ERROR,
+    PROFILE_METRICS,
+    ACTIVITY_PROBE,
+    NoResponseError,
 )
+from models import fetch_follower_cursor, save_follower_cursor
+from models.follower_cursors import LAST_CURSOR
+from models.user_verdicts import MISSING, VALUABLE
+from utils import POOL_METRICS, session_scope
 from utils.functions import parse_target_users
-from utils.settings import DUMPED_FILE, NUM_PER_BATCH
+from utils.id_store import FollowerIdStore
+from utils.settings import (
+    DUMPED_FILE,
+    NUM_PER_BATCH,
+    FOLLOWER_ID_STORE_PATH,
+    FOLLOWER_ID_STORE_FLUSH_SIZE,
+    PIPELINE_CONCURRENCY,
+    PIPELINE_QUEUE_SIZE,
+)
 from .base import LogicBase
+from .batch_evaluate import BatchEvaluate
 from .errors import LogicErrorFileNotFound, LogicError
+from .pipeline import Stage, run_pipeline
+
+
+@dataclass
+class FollowerPage:
+    page_no: int
+    famous_guy: str
+    new_ids: np.ndarray
+    next_cursor: int
+
+
+@dataclass
+class FollowerBatch:
+    page_no: int
+    ids: List[int]
+    users: List[user_account] = field(default_factory=list)
+    tweets: Dict[int, Any] = field(default_factory=dict)
+    verdicts: Dict[int, str] = field(default_factory=dict)
+
+
+class PageProgress:
+    """Call on_done with pages in order once all of their batches have been saved
+
+    on_done gets the session of the batch that completed the page, so that the
+    page is recorded in the same transaction as the batch. expect and done return
+    the pages completed, so that the caller can act on them once that transaction
+    has been committed.
+    """
+
+    def __init__(self, on_done: Callable[[FollowerPage, Optional[Session]], None]):
+        self._on_done = on_done
+        self._pages: Dict[int, FollowerPage] = {}
+        self._num_remaining: Dict[int, int] = {}
+        self._next_page_no = 0
+        self._lock = Lock()
+
+    def expect(self, page: FollowerPage, num_batches: int) -> List[FollowerPage]:
+        with self._lock:
+            self._pages[page.page_no] = page
+            self._num_remaining[page.page_no] = num_batches
+            return self._complete(None)
+
+    def done(self, page_no: int, session: Optional[Session] = None) -> List[FollowerPage]:
+        with self._lock:
+            self._num_remaining[page_no] -= 1
+            return self._complete(session)
+
+    def _complete(self, session: Optional[Session]) -> List[FollowerPage]:
+        completed: List[FollowerPage] = []
+        while self._num_remaining.get(self._next_page_no) == 0:
+            del self._num_remaining[self._next_page_no]
+            page = self._pages.pop(self._next_page_no)
+            self._on_done(page, session)
+            completed.append(page)
+            self._next_page_no += 1
+        return completed
 
 
 @dataclass
 class UserLogic(LogicBase):
+    follower_ids: FollowerIdStore = field(
+        default_factory=lambda: FollowerIdStore(FOLLOWER_ID_STORE_PATH, FOLLOWER_ID_STORE_FLUSH_SIZE)
+    )
+    batch_evaluate: BatchEvaluate = field(default_factory=BatchEvaluate)
 
-    def collect_followers_of_famous_users(self, famous_guys: List[str]) -> List[List[int]]:
-        """collect_followers_of_famous_users_and_save_them_in_db
+    async def collect_followers_of_famous_user(self, famous_guy: str) -> None:
+        """collect followers of famous_guy and save valuable ones in db
 
+        Notes:
+            Pages of follower ids go through the stages below connected by bounded queues,
+            so db work and evaluation run while requests of other batches are in flight.
+            filter(db) -> hydrate(users/lookup) -> timeline(user_timeline) -> evaluate -> save(db)
+            next_cursor of a page is saved once all of its batches have been saved,
+            so a restart resumes from the first page that was not finished.
         """
-        SLACK_INFO.send_message('[save_user]1/4: Fetch all_ids')
-        all_ids: Set[int] = {
-            id_
-            for famous_guy in famous_guys
-            for id_ in self.twitter.fetch_user_follower_ids(famous_guy)
-        }
+        progress = PageProgress(self.complete_page)
+        stages: List[Stage] = [
+            Stage('filter', partial(self.filter_page, progress), PIPELINE_CONCURRENCY['filter'], is_async=True),
+            Stage('hydrate', self.hydrate_batch, PIPELINE_CONCURRENCY['hydrate']),
+            Stage('timeline', self.fetch_timelines_of_batch, PIPELINE_CONCURRENCY['timeline']),
+            Stage('evaluate', self.evaluate_batch, PIPELINE_CONCURRENCY['evaluate']),
+            Stage('save', partial(self.save_batch, progress), PIPELINE_CONCURRENCY['save']),
+        ]
+        try:
+            await run_pipeline(
+                self.iter_follower_pages(famous_guy),
+                stages,
+                self.run_in_thread,
+                PIPELINE_QUEUE_SIZE
+            )
+        finally:
+            await self.run_in_thread(self.follower_ids.flush)
 
-        SLACK_INFO.send_message(
-            f'[save_user]2/4: filter to avoid saving duplicate id. all_ids:{len(all_ids)}'
-        )
-        users_filtered_if_existed: List[int] = self.filter_by_existence_in_database(all_ids)
+    def iter_follower_pages(self, famous_guy: str) -> Iterator[FollowerPage]:
+        cursor: int = self.load_follower_cursor(famous_guy)
+        if cursor == LAST_CURSOR:
+            SLACK_WARNING.send_message(f'[save_user]All followers of {famous_guy} have been fetched.')
+            return
+        SLACK_INFO.send_message(f'[save_user]1/5: Fetch ids of {famous_guy} from cursor {cursor}')
+        pages = self.twitter.iter_user_follower_id_pages(famous_guy, cursor)
+        for page_no, (ids, next_cursor) in enumerate(pages):
+            # Followers shared with famous users processed before are skipped here
+            new_ids = self.follower_ids.unseen(ids)
+            SLACK_INFO.send_message(
+                f'[save_user]1/5: Fetched page {page_no}. ids:{len(ids)} new_ids:{len(new_ids)}'
+            )
+            yield FollowerPage(page_no, famous_guy, new_ids, next_cursor)
 
+    async def filter_page(self, progress: PageProgress, page: FollowerPage) -> List[FollowerBatch]:
+        users_not_in_db: List[int] = await self.fetch_users_not_in_database(page.new_ids.tolist())
+        # Users judged not valuable recently are skipped before spending any request on them.
+        # Valuable ones are not in db yet e.g. their save failed, so they are judged again to be saved.
+        judged: Dict[int, str] = await self.run_in_thread(self.evaluate.verdicts.get_many, users_not_in_db)
+        users_filtered_if_existed: List[int] = [
+            id_ for id_ in users_not_in_db
+            if judged.get(id_, VALUABLE) == VALUABLE
+        ]
         SLACK_INFO.send_message(
-            f'[save_user]3/5: Divide users_filtered_if_existed by {NUM_PER_BATCH}. '
+            f'[save_user]2/5: Divide {len(users_filtered_if_existed)} users not in db by {NUM_PER_BATCH}. '
+            f'{len(users_not_in_db) - len(users_filtered_if_existed)} users were skipped as they had been judged.'
         )
-        user_batches: List[List[int]] = [
-            users_filtered_if_existed[idx:idx + NUM_PER_BATCH]
+        batches: List[FollowerBatch] = [
+            FollowerBatch(page.page_no, users_filtered_if_existed[idx:idx + NUM_PER_BATCH])
             for idx in range(0, len(users_filtered_if_existed), NUM_PER_BATCH)
         ]
+        # A page without batches is completed here, which commits its cursor on its own
+        completed: List[FollowerPage] = await self.run_in_thread(progress.expect, page, len(batches))
+        await self.run_in_thread(self.remember_pages, completed)
+        return batches
 
+    def hydrate_batch(self, batch: FollowerBatch) -> List[FollowerBatch]:
+        users, failed_ids = self.twitter.fetch_users_bulk(batch.ids)
+        result = self.batch_evaluate.evaluate(users)
+        # Ids whose request got no response are left unjudged, so that they are not cached as missing
+        failed = set(failed_ids)
+        batch.verdicts = {id_: MISSING for id_ in batch.ids if id_ not in failed}
+        batch.verdicts.update(result.verdicts())
+        batch.users = [user for user, is_valuable in zip(users, result.mask) if is_valuable]
         SLACK_INFO.send_message(
-            f'[save_user]total batch number is {len(user_batches)}'
+            f'[save_user]3/5: {len(batch.users)}/{len(batch.ids)} users have valuable profiles. '
+            f'rejected: {result.rejections}'
         )
-        return user_batches
+        return [batch]
+
+    def fetch_timelines_of_batch(self, batch: FollowerBatch) -> List[FollowerBatch]:
+        users: List[user_account] = []
+        for user in batch.users:
+            try:
+                batch.tweets[user.id] = self.twitter.fetch_user_timeline(id=user.id, profile=ACTIVITY_PROBE)
+            except NoResponseError:
+                # Neither protected nor inactive as far as we know, so the user is left unjudged
+                del batch.verdicts[user.id]
+                continue
+            users.append(user)
+        batch.users = users
+        return [batch]
 
-    def save_batches(self, user_batch):
+    def evaluate_batch(self, batch: FollowerBatch) -> List[FollowerBatch]:
+        result = self.batch_evaluate.evaluate(batch.users, batch.tweets)
+        batch.verdicts.update(result.verdicts())
+        batch.users = [user for user, is_valuable in zip(batch.users, result.mask) if is_valuable]
+        batch.tweets = {}
         SLACK_INFO.send_message(
-            f'[save_user]4/5: filter based on their values. '
+            f'[save_user]4/5: {len(batch.users)} users are active.'
         )
-        users_filtered_by_value: List[user_account] = [
-            self.evaluate.user_info_cache for id_ in user_batch
-            if self.evaluate.is_valuable_user(id_)
-        ]
+        return [batch]
 
+    def save_batch(self, progress: PageProgress, batch: FollowerBatch) -> List[FollowerBatch]:
+        # Users of the batch and the cursor of the page it completes are committed together
+        with session_scope() as session:
+            num_saved = self.save_new_users(batch.users, session=session)
+            completed = progress.done(batch.page_no, session)
+        self.remember_pages(completed)
+        self.evaluate.verdicts.put_many(batch.verdicts)
         SLACK_INFO.send_message(
-            f'[save_user]Save all of them. users_filtered_by_value{len(users_filtered_by_value)}'
+            f'[save_user]5/5: {num_saved} new users have been saved.'
         )
-        self.save_new_users(users_filtered_by_value)
+        return []
+
+    def complete_page(self, page: FollowerPage, session: Optional[Session] = None) -> None:
+        self.save_follower_cursor(page.famous_guy, page.next_cursor, session)
+
+    def remember_pages(self, pages: List[FollowerPage]) -> None:
+        # Called only after the cursors of pages have been committed, so that a rollback
+        # leaves their ids to be checked against db again instead of skipped
+        for page in pages:
+            self.follower_ids.add(page.new_ids)
+
+    def load_follower_cursor(self, famous_guy: str) -> int:
+        with session_scope() as session:
+            return fetch_follower_cursor(session, famous_guy)
+
+    def save_follower_cursor(self, famous_guy: str, next_cursor: int, session: Optional[Session] = None) -> None:
+        with session_scope(session) as session:
+            save_follower_cursor(session, famous_guy, next_cursor)
 
     @classmethod
     async def main(cls, *args, **kwargs) -> None:
@@ -89,7 +256,7 @@ class UserLogic(LogicBase):
                 continue
             SLACK_INFO.send_message(f'TwitterBot-chan will collect followers of「{famous_guy}」')
             try:
-                user_batches = cls_instance.collect_followers_of_famous_users([famous_guy])
+                await cls_instance.collect_followers_of_famous_user(famous_guy)
             except TweepError as e:
                 SLACK_ERROR.send_message(
                     'An error occurred from tweepy client in UserLogic.'
@@ -113,9 +280,11 @@ class UserLogic(LogicBase):
                 )
                 SLACK_ERROR.send_message(e.with_traceback(tb))
                 raise e
-            for user_batch in user_batches:
-                cls_instance.save_batches(user_batch)
-                await asyncio.sleep(1)
+            SLACK_INFO.send_message(f'[save_user]db pool: {POOL_METRICS}')
+            SLACK_INFO.send_message(f'[save_user]request profiles: {PROFILE_METRICS}')
+            if await cls_instance.run_in_thread(cls_instance.load_follower_cursor, famous_guy) != LAST_CURSOR:
+                SLACK_WARNING.send_message(f'Followers of {famous_guy} were not fetched to the end. Resume next time.')
+                continue
             with open(DUMPED_FILE, mode='a') as f:
                 f.write(f'{famous_guy}\n')
         SLACK_INFO.send_message('****[IMPORTANT]The whole process of registering users ended!*****')
@@ -0,0 +1,116 @@
+import atexit
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import fetch_user_verdicts, save_user_verdicts
+from utils import (
+    SESSION_FACTORY,
+    session_scope,
+    VERDICT_TTL_IN_SECOND,
+    VERDICT_CACHE_SIZE,
+    VERDICT_FLUSH_SIZE,
+)
+
+
+@dataclass
+class VerdictCache:
+    """Verdicts of Evaluate kept in user_verdicts with an in-process LRU in front of it
+
+    A verdict is returned until VERDICT_TTL_IN_SECOND of its kind has passed, so
+    users that have been judged recently cost no API calls. New verdicts are
+    written to db in bulk once flush_size of them are pending, on flush() and at exit.
+    """
+    session_factory: Callable[[], Session] = SESSION_FACTORY
+    max_size: int = VERDICT_CACHE_SIZE
+    flush_size: int = VERDICT_FLUSH_SIZE
+    _lru: 'OrderedDict[int, Tuple[str, datetime]]' = field(default_factory=OrderedDict, init=False, repr=False)
+    _pending: Dict[int, Tuple[str, datetime]] = field(default_factory=dict, init=False, repr=False)
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _is_fresh(verdict: str, evaluated_at: datetime, now: datetime) -> bool:
+        return now - evaluated_at < timedelta(seconds=VERDICT_TTL_IN_SECOND[verdict])
+
+    def get(self, user_id: int) -> Optional[str]:
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, str]:
+        """Return fresh verdicts of user_ids
+
+        Args:
+            user_ids: user ids to look up
+
+        Returns:
+            user id to verdict. Users without a fresh verdict are left out.
+
+        """
+        now = datetime.utcnow()
+        verdicts: Dict[int, str] = {}
+        misses = []
+        with self._lock:
+            for user_id in user_ids:
+                cached = self._lru.get(user_id)
+                if cached is None:
+                    misses.append(user_id)
+                    continue
+                self._lru.move_to_end(user_id)
+                if self._is_fresh(*cached, now):
+                    verdicts[user_id] = cached[0]
+
+        if len(misses) != 0:
+            with session_scope(factory=self.session_factory) as session:
+                saved = fetch_user_verdicts(session, misses)
+            with self._lock:
+                for user_id, cached in saved.items():
+                    self._remember(user_id, cached)
+                    if self._is_fresh(*cached, now):
+                        verdicts[user_id] = cached[0]
+        return verdicts
+
+    def put(self, user_id: int, verdict: str) -> None:
+        self.put_many({user_id: verdict})
+
+    def put_many(self, verdicts: Dict[int, str]) -> None:
+        """Remember verdicts and write them to db once enough are pending
+
+        Args:
+            verdicts: user id to verdict
+
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            for user_id, verdict in verdicts.items():
+                self._remember(user_id, (verdict, now))
+                self._pending[user_id] = (verdict, now)
+            is_full = len(self._pending) >= self.flush_size
+        if is_full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        if len(pending) == 0:
+            return
+
+        try:
+            with session_scope(factory=self.session_factory) as session:
+                save_user_verdicts(session, pending)
+        except Exception:
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            raise
+
+    def _remember(self, user_id: int, cached: Tuple[str, datetime]) -> None:
+        self._lru[user_id] = cached
+        self._lru.move_to_end(user_id)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
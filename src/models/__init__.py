@@ -1,5 +1,48 @@
-from .users import ValuableUsers
+from .follower_cursors import (
+    FollowerCursors,
+    fetch_follower_cursor,
+    save_follower_cursor,
+)
+from .keyword_watermarks import (
+    KeywordWatermarks,
+    fetch_keyword_watermark,
+    save_keyword_watermark,
+)
+from .liked_tweets import (
+    LikedTweets,
+    fetch_liked_tweet_ids,
+    fetch_liked_times_since,
+    iter_all_liked_tweet_ids,
+    save_liked_tweets,
+)
+from .user_verdicts import (
+    UserVerdicts,
+    fetch_user_verdicts,
+    save_user_verdicts,
+)
+from .user_repository import UserCandidate, ValuableUserRepository
+from .users import (
+    ValuableUsers,
+    insert_users_ignoring_existing,
+)
 
 __all__ = [
-    'ValuableUsers'
+    'FollowerCursors',
+    'fetch_follower_cursor',
+    'save_follower_cursor',
+    'KeywordWatermarks',
+    'fetch_keyword_watermark',
+    'save_keyword_watermark',
+    'LikedTweets',
+    'fetch_liked_tweet_ids',
+    'fetch_liked_times_since',
+    'iter_all_liked_tweet_ids',
+    'save_liked_tweets',
+    'UserVerdicts',
+    'fetch_user_verdicts',
+    'save_user_verdicts',
+    'UserCandidate',
+    'ValuableUserRepository',
+    'ValuableUsers',
+    'insert_users_ignoring_existing',
 ]
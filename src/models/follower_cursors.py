@@ -0,0 +1,56 @@
+from sqlalchemy import Column, BigInteger, String
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from utils import Base
+
+FIRST_CURSOR = -1
+LAST_CURSOR = 0
+
+
+class FollowerCursors(Base):
+    """Next page of /followers/ids to fetch for each famous user
+
+    next_cursor is -1 before the first page and 0 once every page has been processed.
+    """
+
+    __tablename__ = 'follower_cursors'
+    famous_user = Column('famous_user', String, primary_key=True)
+    next_cursor = Column('next_cursor', BigInteger, default=FIRST_CURSOR)
+
+
+def fetch_follower_cursor(session: Session, famous_user: str) -> int:
+    """Return the cursor to resume fetching followers of famous_user from
+
+    Args:
+        session: session to run the query with
+        famous_user: famous user written in target_lists
+
+    Returns:
+        Saved next_cursor or FIRST_CURSOR if nothing has been fetched yet
+
+    """
+    next_cursor = session.query(FollowerCursors.next_cursor).filter(
+        FollowerCursors.famous_user == famous_user
+    ).scalar()
+    return FIRST_CURSOR if next_cursor is None else next_cursor
+
+
+def save_follower_cursor(session: Session, famous_user: str, next_cursor: int) -> None:
+    """Save next_cursor of famous_user
+
+    Args:
+        session: session to run the statement with. Caller commits.
+        famous_user: famous user written in target_lists
+        next_cursor: cursor of the page to fetch next
+
+    """
+    table = FollowerCursors.__table__
+    statement = insert(table).values(
+        famous_user=famous_user,
+        next_cursor=next_cursor
+    ).on_conflict_do_update(
+        index_elements=[table.c.famous_user],
+        set_={'next_cursor': next_cursor}
+    )
+    session.execute(statement)
@@ -0,0 +1,59 @@
+from typing import Optional, Tuple
+
+from sqlalchemy import Column, BigInteger, String
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from utils import Base
+
+
+class KeywordWatermarks(Base):
+    """Range of tweet ids that have been processed for each search keyword
+
+    since_id is the newest and max_id the oldest tweet id processed.
+    """
+
+    __tablename__ = 'keyword_watermarks'
+    keyword = Column('keyword', String, primary_key=True)
+    since_id = Column('since_id', BigInteger)
+    max_id = Column('max_id', BigInteger)
+
+
+def fetch_keyword_watermark(session: Session, keyword: str) -> Tuple[Optional[int], Optional[int]]:
+    """Return (since_id, max_id) of keyword or (None, None) if it has never been searched"""
+    row = session.query(
+        KeywordWatermarks.since_id,
+        KeywordWatermarks.max_id,
+    ).filter(
+        KeywordWatermarks.keyword == keyword
+    ).first()
+    if row is None:
+        return None, None
+    return row.since_id, row.max_id
+
+
+def save_keyword_watermark(
+        session: Session,
+        keyword: str,
+        since_id: Optional[int],
+        max_id: Optional[int]
+) -> None:
+    """Save watermarks of keyword
+
+    Args:
+        session: session to run the statement with. Caller commits.
+        keyword: search keyword
+        since_id: newest tweet id processed
+        max_id: oldest tweet id processed
+
+    """
+    table = KeywordWatermarks.__table__
+    statement = insert(table).values(
+        keyword=keyword,
+        since_id=since_id,
+        max_id=max_id
+    ).on_conflict_do_update(
+        index_elements=[table.c.keyword],
+        set_={'since_id': since_id, 'max_id': max_id}
+    )
+    session.execute(statement)
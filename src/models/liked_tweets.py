@@ -0,0 +1,75 @@
+from datetime import datetime
+from typing import Iterator, List, Set
+
+from sqlalchemy import Column, BigInteger, DateTime, Index, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.orm import Session
+
+from utils import Base
+
+
+class LikedTweets(Base):
+    """Tweets that have been liked or tried to be liked
+
+    liked_at also serves as the ledger of like requests for the last 24 hours.
+    """
+
+    __tablename__ = 'liked_tweets'
+    __table_args__ = (
+        Index('ix_liked_tweets_liked_at', 'liked_at'),
+    )
+    tweet_id = Column('id', BigInteger, primary_key=True)
+    liked_at = Column('liked_at', DateTime, nullable=False)
+
+
+def fetch_liked_tweet_ids(session: Session, ids: List[int]) -> Set[int]:
+    """Return ids that are in liked_tweets
+
+    Args:
+        session: session to run the query with
+        ids: tweet ids to look up
+
+    Returns:
+        Subset of ids that have been liked
+
+    """
+    if len(ids) == 0:
+        return set()
+    rows = session.query(LikedTweets.tweet_id).filter(
+        LikedTweets.tweet_id == any_(bindparam('ids', type_=ARRAY(BigInteger)))
+    ).params(ids=ids).all()
+    return {row.tweet_id for row in rows}
+
+
+def iter_all_liked_tweet_ids(session: Session, chunk_size: int = 10000) -> Iterator[int]:
+    """Yield every liked tweet id without loading all of them at once"""
+    query = session.query(LikedTweets.tweet_id).yield_per(chunk_size)
+    for row in query:
+        yield row.tweet_id
+
+
+def fetch_liked_times_since(session: Session, since: datetime) -> List[datetime]:
+    """Return when tweets were liked after since in ascending order"""
+    rows = session.query(LikedTweets.liked_at).filter(
+        LikedTweets.liked_at > since
+    ).order_by(LikedTweets.liked_at).all()
+    return [row.liked_at for row in rows]
+
+
+def save_liked_tweets(session: Session, ids: List[int], liked_at: datetime) -> None:
+    """Save ids as liked with a single statement
+
+    Args:
+        session: session to run the statement with. Caller commits.
+        ids: tweet ids to save
+        liked_at: when they were liked
+
+    """
+    if len(ids) == 0:
+        return
+    table = LikedTweets.__table__
+    statement = insert(table).values([
+        {'id': id_, 'liked_at': liked_at}
+        for id_ in ids
+    ]).on_conflict_do_nothing(index_elements=[table.c.id])
+    session.execute(statement)
@@ -0,0 +1,85 @@
+from typing import Any, Dict, List, NamedTuple, Set
+
+from utils import ASYNC_DATABASE, AsyncDatabase
+
+
+class UserCandidate(NamedTuple):
+    user_id: int
+    screen_name: str
+    num_likes: int
+
+
+async def _fetch_existing_ids(connection, ids: List[int]) -> Set[int]:
+    rows = await connection.fetch(
+        'SELECT id FROM valuable_users WHERE id = ANY($1::BIGINT[])',
+        ids
+    )
+    return {row['id'] for row in rows}
+
+
+async def _insert_ignoring_existing(connection, rows: List[Dict[str, Any]]) -> int:
+    inserted = await connection.fetch(
+        'INSERT INTO valuable_users (id, screen_name, is_friend, num_likes) '
+        'SELECT * FROM unnest($1::BIGINT[], $2::VARCHAR[], $3::BOOLEAN[], $4::INTEGER[]) '
+        'ON CONFLICT (id) DO NOTHING RETURNING id',
+        [row['id'] for row in rows],
+        [row['screen_name'] for row in rows],
+        [row['is_friend'] for row in rows],
+        [row['num_likes'] for row in rows],
+    )
+    return len(inserted)
+
+
+async def _fetch_candidates(connection, data_num: int, threshold_likes: int) -> List[UserCandidate]:
+    rows = await connection.fetch(
+        'SELECT id, screen_name, num_likes FROM valuable_users '
+        'WHERE num_likes < $1 ORDER BY num_likes, id LIMIT $2',
+        threshold_likes,
+        data_num
+    )
+    return [UserCandidate(row['id'], row['screen_name'], row['num_likes']) for row in rows]
+
+
+async def _increment_num_likes(connection, deltas: Dict[int, int]) -> int:
+    status: str = await connection.execute(
+        'UPDATE valuable_users SET num_likes = valuable_users.num_likes + deltas.num '
+        'FROM unnest($1::BIGINT[], $2::INTEGER[]) AS deltas(id, num) '
+        'WHERE valuable_users.id = deltas.id',
+        list(deltas.keys()),
+        list(deltas.values())
+    )
+    # status is like 'UPDATE 3'
+    return int(status.split()[-1])
+
+
+class ValuableUserRepository:
+    """Awaitable access to valuable_users on asyncpg
+
+    Each operation is a single statement like its counterpart in models.users.
+    Worker threads wait for them with database.wait.
+    """
+
+    def __init__(self, database: AsyncDatabase = ASYNC_DATABASE):
+        self.database = database
+
+    async def fetch_existing_ids(self, ids: List[int]) -> Set[int]:
+        """Return ids that are already saved in valuable_users"""
+        if len(ids) == 0:
+            return set()
+        return await self.database.run(_fetch_existing_ids, ids)
+
+    async def insert_ignoring_existing(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert rows(id, screen_name, is_friend, num_likes) and return how many were new"""
+        if len(rows) == 0:
+            return 0
+        return await self.database.run(_insert_ignoring_existing, rows)
+
+    async def fetch_candidates(self, data_num: int, threshold_likes: int) -> List[UserCandidate]:
+        """Return data_num users with the fewest likes under threshold_likes"""
+        return await self.database.run(_fetch_candidates, data_num, threshold_likes)
+
+    async def increment_num_likes(self, deltas: Dict[int, int]) -> int:
+        """Add deltas(user id to likes) to num_likes and return the number of updated users"""
+        if len(deltas) == 0:
+            return 0
+        return await self.database.run(_increment_num_likes, deltas)
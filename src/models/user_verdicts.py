@@ -0,0 +1,73 @@
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Column, BigInteger, DateTime, String, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.orm import Session
+
+from utils import Base
+
+VALUABLE = 'valuable'
+NOT_VALUABLE = 'not_valuable'
+PROTECTED = 'protected'
+MISSING = 'missing'
+
+
+class UserVerdicts(Base):
+    """Latest result of Evaluate for each user
+
+    verdict is one of VALUABLE, NOT_VALUABLE, PROTECTED and MISSING.
+    """
+
+    __tablename__ = 'user_verdicts'
+    user_id = Column('id', BigInteger, primary_key=True)
+    verdict = Column('verdict', String, nullable=False)
+    evaluated_at = Column('evaluated_at', DateTime, nullable=False)
+
+
+def fetch_user_verdicts(session: Session, ids: List[int]) -> Dict[int, Tuple[str, datetime]]:
+    """Return saved verdicts of ids
+
+    Args:
+        session: session to run the query with
+        ids: user ids to look up
+
+    Returns:
+        user id to (verdict, evaluated_at) for ids that have been evaluated
+
+    """
+    if len(ids) == 0:
+        return {}
+    rows = session.query(
+        UserVerdicts.user_id,
+        UserVerdicts.verdict,
+        UserVerdicts.evaluated_at,
+    ).filter(
+        UserVerdicts.user_id == any_(bindparam('ids', type_=ARRAY(BigInteger)))
+    ).params(ids=ids).all()
+    return {row.user_id: (row.verdict, row.evaluated_at) for row in rows}
+
+
+def save_user_verdicts(session: Session, verdicts: Dict[int, Tuple[str, datetime]]) -> None:
+    """Insert or overwrite verdicts with a single statement
+
+    Args:
+        session: session to run the statement with. Caller commits.
+        verdicts: user id to (verdict, evaluated_at)
+
+    """
+    if len(verdicts) == 0:
+        return
+    table = UserVerdicts.__table__
+    statement = insert(table).values([
+        {'id': id_, 'verdict': verdict, 'evaluated_at': evaluated_at}
+        for id_, (verdict, evaluated_at) in verdicts.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={
+            'verdict': statement.excluded.verdict,
+            'evaluated_at': statement.excluded.evaluated_at,
+        }
+    )
+    session.execute(statement)
@@ -1,4 +1,8 @@
-from sqlalchemy import Column, BigInteger, Boolean, String, Integer
+from typing import Any, Dict, List
+
+from sqlalchemy import Column, BigInteger, Boolean, String, Integer, Index, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
 
 from utils import ENGINE, Base
 
@@ -9,11 +13,44 @@ class ValuableUsers(Base):
     """
 
     __tablename__ = 'valuable_users'
+    __table_args__ = (
+        # Candidates to like are picked in this order
+        Index('ix_valuable_users_num_likes_id', 'num_likes', 'id'),
+    )
     user_id = Column('id', BigInteger, primary_key=True)
     screen_name = Column('screen_name', String)
     is_friend = Column('is_friend', Boolean, default=False)
     num_likes = Column('num_likes', Integer, default=0)
 
 
+def insert_users_ignoring_existing(session: Session, rows: List[Dict[str, Any]]) -> int:
+    """Insert rows into valuable_users with a single statement
+
+    Args:
+        session: session to run the statement with. Caller commits.
+        rows: column name to value mappings(id, screen_name, is_friend, num_likes)
+
+    Returns:
+        Number of rows actually inserted
+
+    Notes:
+        INSERT ... ON CONFLICT (id) DO NOTHING skips users saved in the meantime,
+        so there is no need to filter rows by existence beforehand.
+    """
+    if len(rows) == 0:
+        return 0
+    table = ValuableUsers.__table__
+    statement = insert(table).values(rows).on_conflict_do_nothing(
+        index_elements=[table.c.id]
+    ).returning(table.c.id)
+    return len(session.execute(statement).fetchall())
+
+
 def create_table_unless_exists() -> None:
     Base.metadata.create_all(bind=ENGINE)
+    # create_all skips indexes of tables that already exist
+    for index in (index for table in Base.metadata.sorted_tables for index in table.indexes):
+        columns = ', '.join(column.name for column in index.columns)
+        ENGINE.execute(
+            text(f'CREATE INDEX IF NOT EXISTS {index.name} ON {index.table.name} ({columns})')
+        )
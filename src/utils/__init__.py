@@ -1 +1,3 @@
 from .settings import *
+from .database import POOL_METRICS, SESSION_FACTORY, session_scope
+from .async_database import ASYNC_DATABASE, AsyncDatabase
@@ -0,0 +1,82 @@
+import asyncio
+from concurrent.futures import Future
+from threading import Lock, Thread, get_ident
+from typing import Any, Awaitable, Callable, Optional
+
+import asyncpg
+
+from .settings import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_STATEMENT_TIMEOUT_IN_MS,
+)
+
+
+class AsyncDatabase:
+    """asyncpg pool served by an event loop on a thread of its own
+
+    Queries can be awaited from any event loop with run, or waited for from
+    worker threads with wait, and they share one pool either way.
+    """
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = DB_POOL_SIZE):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        # Touched only on the loop of the pool
+        self._pool: Optional[asyncio.Future] = None
+        self._lock = Lock()
+
+    def submit(self, func: Callable[..., Awaitable[Any]], *args) -> Future:
+        """Run func(connection, *args) on the loop of the pool
+
+        Args:
+            func: coroutine function that takes a connection first
+            *args: args of func
+
+        Returns:
+            Future of the return of func
+
+        """
+        self._start()
+        return asyncio.run_coroutine_threadsafe(self._call(func, *args), self._loop)
+
+    async def run(self, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def wait(self, awaitable: Awaitable[Any]) -> Any:
+        """Block a worker thread until awaitable finishes on the loop of the pool"""
+        self._start()
+        if get_ident() == self._thread_id:
+            raise RuntimeError('wait would block the loop of the pool. Await instead.')
+        return asyncio.run_coroutine_threadsafe(awaitable, self._loop).result()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            thread = Thread(target=self._loop.run_forever, daemon=True)
+            thread.start()
+            self._thread_id = thread.ident
+
+    async def _create_pool(self) -> asyncpg.pool.Pool:
+        return await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            server_settings={'statement_timeout': str(DB_STATEMENT_TIMEOUT_IN_MS)},
+        )
+
+    async def _call(self, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        if self._pool is None or (self._pool.done() and self._pool.exception() is not None):
+            # Created on first use and again after a failure, e.g. db was not up yet
+            self._pool = asyncio.ensure_future(self._create_pool())
+        pool = await asyncio.shield(self._pool)
+        async with pool.acquire() as connection:
+            return await func(connection, *args)
+
+
+ASYNC_DATABASE = AsyncDatabase(DATABASE_URL)
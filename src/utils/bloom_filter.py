@@ -0,0 +1,33 @@
+from hashlib import blake2b
+import math
+from typing import Iterator
+
+
+class BloomFilter:
+    """Set of ints that answers "maybe in" or "definitely not in"
+
+    About 1.2MB holds a million ids with 1% false positives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.num_bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, value: int) -> Iterator[int]:
+        digest = blake2b(value.to_bytes(8, 'little', signed=True), digest_size=16).digest()
+        # Double hashing: k positions out of two 64bit hashes
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, value: int) -> None:
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: int) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from .settings import ENGINE
+
+
+@dataclass
+class PoolMetrics:
+    """Connections checked out of the pool and how long sessions waited for one"""
+    checked_out: int = 0
+    peak_checked_out: int = 0
+    checkouts: int = 0
+    sessions: int = 0
+    open_sessions: int = 0
+    peak_open_sessions: int = 0
+    total_wait_in_sec: float = 0.
+    max_wait_in_sec: float = 0.
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    def session_opened(self, wait_in_sec: float) -> None:
+        with self._lock:
+            self.sessions += 1
+            self.open_sessions += 1
+            self.peak_open_sessions = max(self.peak_open_sessions, self.open_sessions)
+            self.total_wait_in_sec += wait_in_sec
+            self.max_wait_in_sec = max(self.max_wait_in_sec, wait_in_sec)
+
+    def session_closed(self) -> None:
+        with self._lock:
+            self.open_sessions -= 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'pool_size': ENGINE.pool.size(),
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'checkouts': self.checkouts,
+                'sessions': self.sessions,
+                'open_sessions': self.open_sessions,
+                'peak_open_sessions': self.peak_open_sessions,
+                'avg_wait_in_sec': self.total_wait_in_sec / self.sessions if self.sessions else 0.,
+                'max_wait_in_sec': self.max_wait_in_sec,
+            }
+
+    def __str__(self) -> str:
+        return ' '.join(
+            f'{key}:{value:.3f}' if isinstance(value, float) else f'{key}:{value}'
+            for key, value in self.snapshot().items()
+        )
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+
+SESSION_FACTORY = sessionmaker(bind=ENGINE, autocommit=False, autoflush=False)
+POOL_METRICS = PoolMetrics()
+POOL_METRICS.attach(ENGINE)
+
+
+@contextmanager
+def session_scope(
+        session: Optional[Session] = None,
+        factory: Callable[[], Session] = SESSION_FACTORY
+) -> Iterator[Session]:
+    """Unit of work that commits on success, rolls back on error and closes the session
+
+    Args:
+        session: session of an outer scope. It is used as is and left to that scope,
+            so that stages can share one session and one transaction for a whole batch.
+        factory: factory of a new session
+
+    Examples:
+        >>> with session_scope() as session:
+        ...     insert_users_ignoring_existing(session, rows)
+
+    """
+    if session is not None:
+        yield session
+        return
+
+    started = time.monotonic()
+    session = factory()
+    try:
+        # Connect right away so that waiting for the pool is measured
+        session.connection()
+    except BaseException:
+        session.close()
+        raise
+    POOL_METRICS.session_opened(time.monotonic() - started)
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        POOL_METRICS.session_closed()
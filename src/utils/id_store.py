@@ -0,0 +1,99 @@
+import os
+from threading import Lock
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+
+class FollowerIdStore:
+    """Sorted int64 array of follower ids that have already been processed
+
+    Each id costs 8 bytes instead of ~70 bytes for an int in a python set,
+    and lookups/merges are vectorised with searchsorted instead of hashing
+    ids one by one. When path is given the array is saved there as .npy and
+    memory-mapped, so it survives restarts and does not have to fit in memory.
+
+    Ids added are buffered in memory as one sorted array per call and merged into
+    the stored array once flush_size of them have piled up or flush is called, so a
+    page of followers neither rewrites the file nor shifts the whole array. Ids not
+    flushed are lost on a crash, which only means they are checked against db once more.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_size: int = 50000):
+        self._path = path
+        self._flush_size = flush_size
+        if path is not None and os.path.exists(path):
+            stored = np.load(path, mmap_mode='r')
+        else:
+            stored = np.empty(0, dtype=np.int64)
+        # (stored, *pending) is replaced as a whole, so readers in other threads see a consistent tuple
+        self._arrays: Tuple[np.ndarray, ...] = (stored,)
+        self._num_pending = 0
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._arrays)
+
+    def __contains__(self, id_: int) -> bool:
+        for ids in self._arrays:
+            idx = np.searchsorted(ids, id_)
+            if idx < len(ids) and ids[idx] == id_:
+                return True
+        return False
+
+    def unseen(self, ids: Iterable[int]) -> np.ndarray:
+        """Return ids that are not in the store
+
+        Args:
+            ids: ids to check. Duplicates are allowed.
+
+        Returns:
+            Sorted unique array of ids that are not in the store
+
+        """
+        return self._unseen_in(self._arrays, np.unique(np.fromiter(ids, dtype=np.int64)))
+
+    def add(self, ids: Iterable[int]) -> None:
+        """Add ids to the store
+
+        Args:
+            ids: ids to add
+
+        """
+        with self._lock:
+            new_ids = self._unseen_in(self._arrays, np.unique(np.fromiter(ids, dtype=np.int64)))
+            if len(new_ids) == 0:
+                return
+            self._arrays = self._arrays + (new_ids,)
+            self._num_pending += len(new_ids)
+            if self._num_pending >= self._flush_size:
+                self._merge_pending()
+
+    def flush(self) -> None:
+        """Merge ids added since the last flush into the stored array and save it to path if any"""
+        with self._lock:
+            self._merge_pending()
+
+    def _merge_pending(self) -> None:
+        stored, *pending = self._arrays
+        if len(pending) == 0:
+            return
+        merged = np.union1d(stored, np.concatenate(pending))
+        if self._path is not None:
+            tmp_path = f'{self._path}.tmp'
+            with open(tmp_path, mode='wb') as f:
+                np.save(f, merged)
+            os.replace(tmp_path, self._path)
+            merged = np.load(self._path, mmap_mode='r')
+        self._arrays = (merged,)
+        self._num_pending = 0
+
+    @staticmethod
+    def _unseen_in(arrays: Tuple[np.ndarray, ...], candidates: np.ndarray) -> np.ndarray:
+        for ids in arrays:
+            if len(ids) == 0 or len(candidates) == 0:
+                continue
+            positions = np.searchsorted(ids, candidates)
+            found = ids[np.minimum(positions, len(ids) - 1)] == candidates
+            candidates = candidates[~found]
+        return candidates
@@ -2,7 +2,6 @@ import os
 from typing import List, Tuple
 
 from sqlalchemy.engine import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -24,30 +23,45 @@ if not DEBUG:
     DBNAME = os.environ['DBNAME'],
     ECHO = False
 
+# Each logic runs THREADS_PER_LOGIC threads and the like pacer and flushes add a few more
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 10
+DB_POOL_TIMEOUT_IN_SECOND = 30
+DB_POOL_RECYCLE_IN_SECOND = 30 * 60
+DB_STATEMENT_TIMEOUT_IN_MS = 30 * 1000
+
+# Set DATABASE_URL to use another database e.g. for benchmarks
+DATABASE_URL = os.environ.get('DATABASE_URL', f'{DB}://{USER}:{PASSWORD}@{HOST}/{DBNAME}')
 ENGINE = create_engine(
-    f'{DB}://{USER}:{PASSWORD}@{HOST}/{DBNAME}',
+    DATABASE_URL,
     encoding="utf-8",
-    echo=ECHO
-)
-session = scoped_session(
-    sessionmaker(
-        autocommit=False,
-        autoflush=False,
-        bind=ENGINE
-    )
+    echo=ECHO,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT_IN_SECOND,
+    pool_recycle=DB_POOL_RECYCLE_IN_SECOND,
+    pool_pre_ping=True,
+    connect_args={'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_IN_MS}'},
 )
 Base = declarative_base()
-Base.query = session.query_property()
 
 
 # Twitter secrets
-CONSUMER_KEY = os.environ['CONSUMER_KEY']
-CONSUMER_SECRET = os.environ['CONSUMER_SECRET']
-ACCESS_TOKEN = os.environ['ACCESS_TOKEN']
-ACCESS_TOKEN_SECRET = os.environ['ACCESS_TOKEN_SECRET']
+# Empty secrets are fine for a stand-in server(benchmarks/fake_api.py) but not for twitter
+CONSUMER_KEY = os.environ.get('CONSUMER_KEY', '')
+CONSUMER_SECRET = os.environ.get('CONSUMER_SECRET', '')
+ACCESS_TOKEN = os.environ.get('ACCESS_TOKEN', '')
+ACCESS_TOKEN_SECRET = os.environ.get('ACCESS_TOKEN_SECRET', '')
+# tweepy always requests https://TWITTER_API_HOST
+TWITTER_API_HOST = os.environ.get('TWITTER_API_HOST', 'api.twitter.com')
+# 'record' saves responses of twitter to TWITTER_CASSETTE_PATH and 'replay' serves them without network.
+# Leave it unset to talk to twitter as usual.
+TWITTER_CASSETTE_MODE = os.environ.get('TWITTER_CASSETTE_MODE')
+TWITTER_CASSETTE_PATH = os.environ.get('TWITTER_CASSETTE_PATH', 'cassettes/twitter.jsonl.zst')
 
 # Slack secrets
-SLACK_TOKEN = os.environ['SLACK_TOKEN']
+SLACK_TOKEN = os.environ.get('SLACK_TOKEN', '')
+SLACK_API_URL = os.environ.get('SLACK_API_URL', 'https://slack.com/api/chat.postMessage')
 
 if DEBUG:
     print(
@@ -88,10 +102,63 @@ TARGET_KEYWORD_AND_IMPORTANCE: List[Tuple[str, int]] = [
 # Client
 REQUEST_LIMIT_RECOVERY_TIME_IN_SECOND = 60 * 15
 RETRY_NUM = 3
+USERS_LOOKUP_LIMIT = 100
+RATE_LIMIT_WAIT_NOTIFICATION_IN_SECOND = 60
 LIKE_LIMIT_PER_DAY = 150
+# Statuses and users are parsed into lean records(clients/records.py) instead of tweepy models
+LEAN_TWITTER_RESPONSES = True
+SLACK_COALESCE_INTERVAL_IN_SECOND = 5
+SLACK_MIN_INTERVAL_IN_SECOND = 1
+SLACK_MESSAGE_MAX_LENGTH = 3000
+SLACK_FLUSH_TIMEOUT_IN_SECOND = 30
 
 
 # Settings for logics
+THREADS_PER_LOGIC = 8
 DUMPED_FILE = 'target_lists/dumped_users.txt'
 DB_LIKES = 50
+# Pages(100 tweets each) to search per keyword until enough tweets to like are found
+KEYWORD_SEARCH_MAX_PAGES = 3
+# Keywords are merged into OR queries up to these limits
+SEARCH_QUERY_MAX_LENGTH = 500
+SEARCH_KEYWORDS_PER_QUERY = 4
+# Daily likes are allocated to keywords and db by importance * likes per API call(yield)
+LIKE_BUDGET_WINDOW_IN_SECOND = 24 * 60 * 60
+DB_LIKES_IMPORTANCE = 3
+LIKE_YIELD_PRIOR = 1.0
+LIKE_YIELD_FLOOR = 0.05
+LIKE_YIELD_SMOOTHING = 0.3
+# Likes are spaced LIKE_BUDGET_WINDOW_IN_SECOND / LIKE_LIMIT_PER_DAY apart, catching up at most LIKE_PACE_BURST
+LIKE_PACE_BURST = 5
+# Likes are suspended this long on 429 unless Twitter tells when it ends
+LIKE_LOCKOUT_IN_SECOND = 60 * 60
 NUM_PER_BATCH = 100
+# Set a path(.npy) to keep processed follower ids on disk across restarts
+FOLLOWER_ID_STORE_PATH = None
+# Ids added to the store are written to FOLLOWER_ID_STORE_PATH once this many have piled up
+FOLLOWER_ID_STORE_FLUSH_SIZE = 50000
+EXISTENCE_CHECK_CHUNK_SIZE = 10000
+# Number of items each stage of UserLogic processes at a time
+PIPELINE_CONCURRENCY = {
+    'filter': 1,
+    'hydrate': 1,
+    'timeline': 2,
+    'evaluate': 1,
+    'save': 1,
+}
+PIPELINE_QUEUE_SIZE = 4
+# Verdicts of Evaluate are reused until they expire
+VERDICT_TTL_IN_SECOND = {
+    'valuable': 30 * 24 * 60 * 60,
+    'not_valuable': 14 * 24 * 60 * 60,
+    'protected': 7 * 24 * 60 * 60,
+    'missing': 7 * 24 * 60 * 60,
+}
+VERDICT_CACHE_SIZE = 100000
+VERDICT_FLUSH_SIZE = 500
+LIKED_TWEETS_BLOOM_CAPACITY = 1000000
+# Pages(200 tweets each) of favorites/list to seed liked_tweets with at start. 0 to skip.
+LIKED_TWEETS_SEED_PAGES = 0
+BULK_INSERT_CHUNK_SIZE = 5000
+LIKE_COUNT_FLUSH_SIZE = 50
+LIKE_COUNT_FLUSH_INTERVAL_IN_SECOND = 60